@@ -1,6 +1,7 @@
 import json
+import concurrent.futures
+import itertools
 import pydantic
-import requests
 import time
 import os
 from typing import List, Optional
@@ -9,37 +10,26 @@ import vertexai
 from vertexai.generative_models import GenerativeModel, GenerationConfig
 from utils.tts import TTSManager
 from utils.config import Config
+from utils.rate_limiter import gemini_limiter, model_key
+from utils.http_client import http_client
+from utils.landmark_cache import LandmarkCache
+from utils.geocode_cache import GeocodeCache
+from utils.wikipedia import WikipediaClient
+from utils.speech_stream import SpeechFieldExtractor, SentenceSplitter
+from utils.media_cache import media_cache
+from utils.conversation import history_messages, fit_to_budget, fallback_summary, prompt_metrics
+from utils.language_id import language_identifier
+from utils.gazetteer import load_gazetteer
+from utils.structured_output import JSONStreamParser, ParseMetrics, extract_json_text, parse_json, response_schema_for
 
 load_dotenv()
 
 def extract_json_from_response(text):
-    """Extract JSON from response that might be wrapped in markdown code blocks"""
-    if not text:
-        return None
-    
-    # Remove markdown code blocks if present
-    text = text.strip()
-    
-    # Check for ```json ... ``` or ``` ... ``` format
-    if text.startswith('```'):
-        # Find the actual JSON content
-        lines = text.split('\n')
-        # Remove first line (```json or ```)
-        if lines[0].strip() in ['```json', '```']:
-            lines = lines[1:]
-        # Remove last line (```)
-        if lines and lines[-1].strip() == '```':
-            lines = lines[:-1]
-        text = '\n'.join(lines)
-    
-    return text.strip()
-
-def call_gemini(model, system_prompt, messages=None, temperature=0.7, max_tokens=4000):
-    """Helper function to call Vertex AI Gemini with proper message formatting."""
-    # Simple rate limiting for experimental models to avoid Quota Exceeded
-    time.sleep(5)
+    """Extract the JSON from a response that might be wrapped in markdown code blocks or prose"""
+    return extract_json_text(text)
 
-    # Build the prompt combining system and messages
+def build_prompt(system_prompt, messages=None):
+    """Combine the system prompt and chat messages into a single prompt string."""
     prompt_parts = []
     
     if system_prompt:
@@ -54,22 +44,87 @@ def call_gemini(model, system_prompt, messages=None, temperature=0.7, max_tokens
             elif role == 'assistant':
                 prompt_parts.append(f"Assistant: {content}")
     
-    full_prompt = "\n\n".join(prompt_parts)
-    
+    return "\n\n".join(prompt_parts)
+
+def build_generation_config(temperature, max_tokens, response_mime_type=None, response_schema=None):
     # Configure generation settings
-    generation_config = GenerationConfig(
-        temperature=temperature,
-        max_output_tokens=max_tokens,
-    )
-    
-    # Make the API call
-    response = model.generate_content(
+    generation_kwargs = {
+        'temperature': temperature,
+        'max_output_tokens': max_tokens,
+    }
+    if response_mime_type:
+        generation_kwargs['response_mime_type'] = response_mime_type
+    if response_schema:
+        generation_kwargs['response_schema'] = response_schema
+    return GenerationConfig(**generation_kwargs)
+
+def call_gemini(model, system_prompt, messages=None, temperature=0.7, max_tokens=4000,
+                response_mime_type=None, response_schema=None):
+    """
+    Helper function to call Vertex AI Gemini with proper message formatting.
+    Pass `response_mime_type="application/json"` (and optionally a `response_schema`)
+    to get structured output instead of free text.
+    """
+    full_prompt = build_prompt(system_prompt, messages)
+    generation_config = build_generation_config(temperature, max_tokens, response_mime_type, response_schema)
+
+    # Make the API call (throttled only when the model's QPM budget is exhausted)
+    response = gemini_limiter.call(
+        model_key(model),
+        model.generate_content,
         full_prompt,
         generation_config=generation_config
     )
     
     return response.text
 
+def call_gemini_stream(model, system_prompt, messages=None, temperature=0.7, max_tokens=4000,
+                       response_mime_type=None, response_schema=None):
+    """
+    Streaming variant of `call_gemini`: yields text chunks as the model generates them.
+    Quota errors are retried only until the first chunk has arrived.
+    """
+    full_prompt = build_prompt(system_prompt, messages)
+    generation_config = build_generation_config(temperature, max_tokens, response_mime_type, response_schema)
+
+    def start_stream():
+        stream = iter(model.generate_content(full_prompt, generation_config=generation_config, stream=True))
+        # Pull the first chunk here so quota errors surface inside the limiter's retry loop
+        return next(stream, None), stream
+
+    first, stream = gemini_limiter.call(model_key(model), start_stream)
+    if first is None:
+        return
+    for chunk in itertools.chain([first], stream):
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. only finish/safety metadata)
+            continue
+        if text:
+            yield text
+
+
+def _resolved_future(value):
+    """A Future that already holds `value`, for results computed without the pool."""
+    future = concurrent.futures.Future()
+    future.set_result(value)
+    return future
+
+
+def merge_preferences(existing, inferred):
+    """Union list fields (keeping order) and prefer newly inferred scalar fields."""
+    merged = dict(existing or {})
+    for key, value in (inferred or {}).items():
+        if isinstance(value, list):
+            current = merged.get(key) or []
+            merged[key] = current + [item for item in value if item not in current]
+        elif value:
+            merged[key] = value
+        else:
+            merged.setdefault(key, value)
+    return merged
+
 
 class Location(pydantic.BaseModel):
     latitude: float
@@ -87,6 +142,7 @@ class CityWalkResponse(pydantic.BaseModel):
     locations: List[Location]
     speech: str
     audio_url: Optional[str] = None
+    session_id: Optional[str] = None
 
 class InformationSeeking(pydantic.BaseModel):
     prediction: bool
@@ -110,24 +166,66 @@ class Language(pydantic.BaseModel):
 class Translation(pydantic.BaseModel):
     translated_text: str
 
+# Structured output of the main answer call; audio_url and session_id are filled in by the server
+MAIN_RESPONSE_SCHEMA = response_schema_for(CityWalkResponse, exclude=("audio_url", "session_id"))
+
+FALLBACK_SPEECH = "I apologize, I'm having trouble processing that request. Could you try asking again?"
+
+# Structured output of the single "turn router" call (see CityWalkAgent.route_turn)
+TURN_ROUTER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "language": {"type": "string"},
+        "translated_query": {"type": "string"},
+        "is_target_city": {"type": "boolean"},
+        "target_city": {"type": "string", "nullable": True},
+        "is_information_seeking": {"type": "boolean"},
+        "information_location": {"type": "string", "nullable": True},
+    },
+    "required": ["language", "translated_query", "is_target_city", "is_information_seeking"],
+}
+
 class CityWalkAgent:
+    """
+    Stateless tour-guide agent. Per-user state (conversation, language, last city,
+    preferences) lives in a SessionState passed to `answer`, so one agent instance
+    can serve many users concurrently.
+    """
     def __init__(self):
-        self.memory = {}
-        self.language = "English"
-        self.conversation = {}
-        
         # Configure Vertex AI
         vertexai.init(project=Config.GCP_PROJECT_ID, location="us-central1")
         # Using Gemini 3 Flash Preview - Latest Dec 2025 model
         self.client = GenerativeModel(Config.TEXT_MODEL)
         self.tts = TTSManager()
+        # Shared pool for the independent lookups of a turn. Tasks never wait on
+        # other pool tasks, so a saturated pool only queues work and cannot deadlock.
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=Config.AGENT_TURN_WORKERS,
+            thread_name_prefix="citywalk-turn"
+        )
+        self.geocode_cache = GeocodeCache(Config.GEOCODE_CACHE_PATH, Config.GEOCODE_NEGATIVE_TTL_SECONDS)
+        self.geocode_cache.preload(Config.GEOCODE_SEED_PATH)
+        self.wikipedia = WikipediaClient(
+            Config.WIKIPEDIA_CACHE_PATH,
+            ttl_seconds=Config.WIKIPEDIA_CACHE_TTL_SECONDS,
+            max_memory_entries=Config.WIKIPEDIA_CACHE_MAX_ENTRIES
+        )
+        self.gazetteer = load_gazetteer(Config.GAZETTEER_PATH) if Config.CITY_GAZETTEER else None
+        self.landmark_cache = None
+        if Config.LANDMARK_CACHE_ENABLED:
+            self.landmark_cache = LandmarkCache(
+                fetch_tile=self.search_nearby_places,
+                precision=Config.LANDMARK_TILE_PRECISION,
+                ttl_seconds=Config.LANDMARK_CACHE_TTL_SECONDS,
+                max_tiles=Config.LANDMARK_CACHE_MAX_TILES
+            )
         
         self.system_prompt =  {
             "role": "system",
             "content": """
             You are Sherpa, a multilingual professional Personal Tour Guide. 
             You are taking a visitor on a city walk.
-            Your speech response should ALWAYS be in the language of {language}. 
+            Your speech response should ALWAYS be in the language given as RESPONSE LANGUAGE. 
             You will be provided with a list of information about the city and the visitor's interests.
             
             INPUT CONTEXT EXPLANATION:
@@ -154,8 +252,7 @@ class CityWalkAgent:
             
             for information seeking queries, you should provide about 5 sentences of information about the location, guide the visitor to ask more questions if they want to know more.
 
-            ADDITIONAL INFORMATION:
-            {additional_info}
+            ADDITIONAL INFORMATION and the RESPONSE LANGUAGE are provided with each turn, after these instructions.
 
             JSON example 1: location recommnedations:
             {{
@@ -231,61 +328,15 @@ class CityWalkAgent:
 
             """
         }
-        self.conversation = []
-
-    def conversation_reset(self):
-        self.conversation = []
+        # Identical on every call, so it is attached to the main model once as its system instruction
+        self.static_system_prompt = self.system_prompt['content'].format()
+        self.main_model = GenerativeModel(Config.TEXT_MODEL, system_instruction=self.static_system_prompt)
+        self.response_parse_metrics = ParseMetrics()
 
-        
     def get_wikipedia_article(self, query):
+        """Intro of the best-matching English Wikipedia article (cached, '' on failure)."""
         try:
-            # Step 1: Perform the search to get article snippets
-            search_url = "https://en.wikipedia.org/w/api.php"
-            search_params = {
-                'action': 'query',
-                'list': 'search',
-                'srsearch': query,
-                'format': 'json'
-            }
-            # Wikipedia requires a User-Agent
-            headers = {
-                'User-Agent': 'SherpaTourGuide/1.0 (contact@example.com)'
-            }
-
-            # Reduced timeout to 2.0s to avoid blocking the user experience too long
-            search_response = requests.get(search_url, params=search_params, headers=headers, timeout=2.0)
-            
-            # Check if response is valid JSON
-            try:
-                search_data = search_response.json()
-            except ValueError:
-                print(f"Wikipedia search returned non-JSON response for '{query}'")
-                return ""
-
-            # Check if search results are available
-            if search_data.get('query') and search_data['query'].get('search'):
-                first_result = search_data['query']['search'][0]
-                pageid = first_result['pageid']
-                
-                # Step 2: Retrieve the full article content using the pageid
-                article_url = "https://en.wikipedia.org/w/api.php"
-                article_params = {
-                    'action': 'query',
-                    'prop': 'extracts',
-                    'pageids': pageid,
-                    'explaintext': True,
-                    'format': 'json',
-                    'exintro': True, # Only get the intro to be faster/smaller
-                }
-                
-                article_response = requests.get(article_url, params=article_params, headers=headers, timeout=2.0)
-                article_data = article_response.json()
-                
-                # The extract is contained in the pages object, with the key as the pageid
-                full_article = article_data['query']['pages'][str(pageid)].get('extract', '')
-                return full_article
-            else:
-                return ""
+            return self.wikipedia.article(query)
         except Exception as e:
             # Silent fail or just print simple error to not clutter logs
             print(f"Wikipedia API skipped for '{query}': {e}")
@@ -294,6 +345,15 @@ class CityWalkAgent:
 
 
     def language_detection(self, query):
+        """Language of the query: identified on-box, with the Gemini call only when confidence is low."""
+        start = time.time()
+        language = language_identifier.detect(query)
+        if language:
+            print(f"[Language] '{language}' identified locally in {(time.time() - start) * 1e6:.0f}us")
+            return language
+        return self.language_detection_llm(query)
+
+    def language_detection_llm(self, query):
         # use the query to determine the language
         system_prompt = """
             You will be provided with the user query.
@@ -326,7 +386,22 @@ class CityWalkAgent:
             return "English"
 
     def get_nearby_landmarks(self, city):
+        """Tourist attractions around the city center, served from the tile cache when enabled."""
+        if self.landmark_cache:
+            return self.landmark_cache.nearby(
+                city['latitude'],
+                city['longitude'],
+                Config.LANDMARK_SEARCH_RADIUS_M,
+                max_results=20
+            )
+        try:
+            return self.search_nearby_places(city['latitude'], city['longitude'], Config.LANDMARK_SEARCH_RADIUS_M)
+        except Exception as e:
+            print(f"Places searchNearby failed: {e}")
+            return []
 
+    def search_nearby_places(self, latitude, longitude, radius):
+        """Places searchNearby call; also used by the landmark cache to fill one tile."""
         headers = {
             'Content-Type': 'application/json',
             'X-Goog-Api-Key': os.getenv('GOOGLE_API_KEY'),
@@ -341,15 +416,17 @@ class CityWalkAgent:
             'locationRestriction': {
                 'circle': {
                     'center': {
-                        'latitude': city['latitude'],
-                        'longitude': city['longitude'],
+                        'latitude': latitude,
+                        'longitude': longitude,
                     },
-                    'radius': 5000.0,
+                    'radius': float(radius),
                 },
             },
         }
 
-        response = requests.post('https://places.googleapis.com/v1/places:searchNearby', headers=headers, json=json_data)
+        response = http_client.post('https://places.googleapis.com/v1/places:searchNearby', endpoint="places.searchNearby", headers=headers, json=json_data)
+        # Raise on API errors so an error is never cached as an empty tile
+        response.raise_for_status()
         if 'places' not in response.json():
             return []
         places = response.json()['places']
@@ -363,8 +440,21 @@ class CityWalkAgent:
             place['location']['rating'] = rating
         return places
 
-    def detect_target_city(self, query):
-        """Detect if user wants to tour a specific city from their query."""
+    def detect_target_city(self, query, conversation):
+        """
+        Detect if user wants to tour a specific city from their query. Clear cases
+        are answered by the local gazetteer (with coordinates); the LLM handles
+        ambiguous or indirect ones.
+        """
+        if self.gazetteer:
+            start = time.time()
+            local = self.gazetteer.detect_city(query, conversation)
+            if local is not None:
+                print(f"[City Detection] Query: '{query}' -> Gazetteer: {local} in {(time.time() - start) * 1e6:.0f}us")
+                return local
+        return self.detect_target_city_llm(query, conversation)
+
+    def detect_target_city_llm(self, query, conversation):
         system_prompt = """
             You are a location extraction assistant. Analyze the user's query and extract ANY city or location they mention wanting to tour, visit, explore, or learn about.
             
@@ -404,7 +494,7 @@ class CityWalkAgent:
         
         response_text = call_gemini(
             model=self.client,
-            system_prompt=system_prompt.format(conversations=json.dumps(self.conversation), query=query),
+            system_prompt=system_prompt.format(conversations=json.dumps(conversation), query=query),
             messages=None,
             temperature=0.3,
             max_tokens=200
@@ -423,31 +513,45 @@ class CityWalkAgent:
             return {'is_different_city': False, 'target_city': None}
 
     def get_city_coordinates(self, city_name):
-        """Geocode a city name to get its latitude and longitude."""
+        """Geocode a city name to get its latitude and longitude (gazetteer, then the persistent cache)."""
+        if self.gazetteer:
+            coords = self.gazetteer.lookup(city_name)
+            if coords:
+                print(f"Gazetteer hit for '{city_name}': {coords}")
+                return coords
+        cached = self.geocode_cache.get(city_name)
+        if cached is not GeocodeCache.MISS:
+            print(f"Geocode cache hit for '{city_name}': {cached}")
+            return cached
         try:
             # Use Google Geocoding API
             params = {
                 'address': city_name,
                 'key': os.getenv('GOOGLE_API_KEY')
             }
-            response = requests.get('https://maps.googleapis.com/maps/api/geocode/json', params=params, timeout=5)
+            response = http_client.get('https://maps.googleapis.com/maps/api/geocode/json', endpoint="geocoding", params=params)
             data = response.json()
             
             if data.get('status') == 'OK' and data.get('results'):
                 location = data['results'][0]['geometry']['location']
                 print(f"Geocoded '{city_name}' to: {location}")
-                return {
+                coords = {
                     'lat': location['lat'],
                     'lng': location['lng']
                 }
+                self.geocode_cache.put(city_name, coords)
+                return coords
             else:
                 print(f"Geocoding failed for '{city_name}': {data.get('status')}")
+                # Only a definitive "no such place" is cached; quota/transient errors are retried next time
+                if data.get('status') == 'ZERO_RESULTS':
+                    self.geocode_cache.put(city_name, None)
                 return None
         except Exception as e:
             print(f"Geocoding error for '{city_name}': {e}")
             return None
     
-    def infer_user_preferences(self):
+    def infer_user_preferences(self, conversation):
         # use the conversation to infer the user preferences
         system_prompt = """
             You are a professional Personal Tour Guide. You are taking a visitor on a city walk.
@@ -483,14 +587,9 @@ class CityWalkAgent:
 
         """
     
-        system_turn = [{
-            "role": "system",
-            "content": system_prompt.format(conversations=json.dumps(self.conversation))
-        }]
-
         response_text = call_gemini(
             model=self.client,
-            system_prompt=system_prompt.format(conversations=json.dumps(self.conversation)),
+            system_prompt=system_prompt.format(conversations=json.dumps(conversation)),
             messages=None,
             temperature=0.5,
             max_tokens=2000
@@ -511,6 +610,84 @@ class CityWalkAgent:
             print(f"Failed to parse preferences response: {response_text}")
             return {'likes': [], 'dislikes': [], 'age': '', 'education': '', 'profession': '', 'visited': []}
 
+    def update_session_preferences(self, sessions, session_id):
+        """
+        Infers preferences from the session's conversation and merges them into the
+        stored session. Runs off the response path on the background task queue.
+        """
+        session = sessions.get(session_id)
+        with session.lock:
+            conversation = history_messages(session)
+        if not conversation:
+            return
+        inferred = self.infer_user_preferences(conversation)
+
+        # Re-read so a turn that finished meanwhile (possibly on another worker) is kept
+        session = sessions.get(session_id)
+        with session.lock:
+            session.preferences = merge_preferences(session.preferences, inferred)
+            sessions.save(session)
+        print(f"[Preferences] Updated for session {session_id}: {session.preferences}")
+
+    def summarize_history(self, previous_summary, messages):
+        """Folds `messages` into the rolling conversation summary."""
+        system_prompt = f"""
+            You maintain a running summary of a conversation between a visitor and their city tour guide.
+            Update the summary with the new messages. Keep what matters for later turns: the city, places
+            discussed or recommended, the visitor's interests, constraints and decisions.
+            Answer with the summary only, in English, at most {Config.HISTORY_SUMMARY_MAX_WORDS} words.
+
+            Current summary:
+            {previous_summary or "(none)"}
+
+            New messages:
+            {json.dumps(messages)}
+            """
+        try:
+            summary = call_gemini(
+                model=self.client,
+                system_prompt=system_prompt,
+                messages=None,
+                temperature=0.2,
+                max_tokens=400
+            ).strip()
+            if summary:
+                return summary
+        except Exception as e:
+            print(f"History summarization failed, using extractive summary: {e}")
+        return fallback_summary(previous_summary, messages)
+
+    def compact_session_history(self, sessions, session_id):
+        """
+        Replaces all but the last HISTORY_KEEP_MESSAGES messages of a session with
+        the rolling summary. Runs on the background task queue.
+        """
+        session = sessions.get(session_id)
+        with session.lock:
+            conversation = list(session.conversation)
+            previous_summary = session.summary
+        overflow = len(conversation) - Config.HISTORY_KEEP_MESSAGES
+        if overflow <= 0:
+            return
+        overflow += overflow % 2  # Keep user/assistant exchanges together
+        compacted = conversation[:overflow]
+        summary = self.summarize_history(previous_summary, compacted)
+
+        session = sessions.get(session_id)
+        with session.lock:
+            # Skip if the history was reset or compacted meanwhile
+            if session.conversation[:overflow] != compacted or session.summary != previous_summary:
+                return
+            session.conversation = session.conversation[overflow:]
+            session.summary = summary
+            sessions.save(session)
+        print(f"[History] Compacted {overflow} messages for session {session_id}")
+
+    def update_session_background(self, sessions, session_id):
+        """Post-response session maintenance: preference inference, then history compaction."""
+        self.update_session_preferences(sessions, session_id)
+        self.compact_session_history(sessions, session_id)
+
     def search_location(self, location_name):
 
         headers = {
@@ -523,13 +700,13 @@ class CityWalkAgent:
             'textQuery': location_name,
         }
 
-        response = requests.post('https://places.googleapis.com/v1/places:searchText', headers=headers, json=json_data)
+        response = http_client.post('https://places.googleapis.com/v1/places:searchText', endpoint="places.searchText", headers=headers, json=json_data)
 
         return response.json()['places'][0]
 
 
 
-    def is_location_information_seeking(self, query):
+    def is_location_information_seeking(self, query, conversation):
         # use the query to determine if the user is seeking information
 
         system_prompt = """
@@ -569,7 +746,7 @@ class CityWalkAgent:
         """
         response_text = call_gemini(
             model=self.client,
-            system_prompt=system_prompt.format(conversations=json.dumps(self.conversation), query=query),
+            system_prompt=system_prompt.format(conversations=json.dumps(conversation), query=query),
             messages=None,
             temperature=0.3,
             max_tokens=500
@@ -585,7 +762,7 @@ class CityWalkAgent:
             print(f"Failed to parse location seeking response: {response_text}")
             return {'prediction': False, 'location': None}
 
-    def translate(self, text):
+    def translate(self, text, target_language):
         # translate the text to the user language
         system_prompt = """
             You will be provided with the text that needs to be translated to the target language.
@@ -607,7 +784,7 @@ class CityWalkAgent:
 
         response_text = call_gemini(
             model=self.client,
-            system_prompt=system_prompt.format(text=text, target_language=self.language),
+            system_prompt=system_prompt.format(text=text, target_language=target_language),
             messages=None,
             temperature=0.3,
             max_tokens=500
@@ -621,132 +798,390 @@ class CityWalkAgent:
             return text
 
 
-    def answer(self, query, metadata, first_request):
+    def route_turn(self, query, conversation, first_request, language):
+        """
+        Single structured call replacing language_detection/translate,
+        detect_target_city and is_location_information_seeking.
+        Returns None when the output can't be used, so callers fall back to the
+        per-function classifiers.
+        """
+        system_prompt = """
+            You are the request router of a multilingual city-walk tour guide.
+            Analyze the last user query (with the conversation history for context) and return ALL of the following:
+
+            1. "language": the language the user query is written in.
+            2. "translated_query": {translation_instruction}
+            3. "is_target_city" / "target_city": whether the user mentions ANY city or location they want to tour, visit,
+               explore, or learn about, as "City Name, Country" (e.g. "Paris, France", "Jaipur, India", "Singapore").
+               Be VERY aggressive about detecting city names. Use false/null only when the query is completely generic
+               (like "hello"), asks about a specific monument without a city context, or is a follow-up about already-displayed places.
+            4. "is_information_seeking" / "information_location": whether the user is seeking information about a specific
+               location (e.g. "Tell me about the history of the city", "Who lives in this place?", "Tell me about place X in location Y"),
+               and the most specific location name they ask about. Requests for recommendations
+               (e.g. "What are the best places to visit?", "Recommend some restaurants") are NOT information seeking.
+
+            CONVERSATION HISTORY:
+            {conversations}
+
+            USER QUERY:
+            {query}
+
+            Return JSON:
+            {{
+                "language": "language",
+                "translated_query": "query",
+                "is_target_city": true/false,
+                "target_city": "City Name, Country" or null,
+                "is_information_seeking": true/false,
+                "information_location": "location name" or null
+            }}
+        """
         if first_request:
-            self.language = self.language_detection(query)
-            # Reset conversation on first request to be safe
-            self.conversation = [] 
+            translation_instruction = "the user query unchanged."
         else:
-            query = self.translate(query)
-        
+            translation_instruction = f"the user query translated to {language} (unchanged if it already is)."
+
+        response_text = None
+        try:
+            response_text = call_gemini(
+                model=self.client,
+                system_prompt=system_prompt.format(
+                    translation_instruction=translation_instruction,
+                    conversations=json.dumps(conversation),
+                    query=query
+                ),
+                messages=None,
+                temperature=0.3,
+                max_tokens=500,
+                response_mime_type="application/json",
+                response_schema=TURN_ROUTER_SCHEMA
+            )
+            parsed = json.loads(extract_json_from_response(response_text))
+            routed = {
+                'language': parsed.get('language') or 'English',
+                'query': parsed.get('translated_query') or query,
+                'target_city': {
+                    'is_different_city': bool(parsed.get('is_target_city')) and bool(parsed.get('target_city')),
+                    'target_city': parsed.get('target_city')
+                },
+                'location_seeking': {
+                    'prediction': bool(parsed.get('is_information_seeking')) and bool(parsed.get('information_location')),
+                    'location': parsed.get('information_location')
+                }
+            }
+            print(f"[Turn Router] Query: '{query}' -> {routed}")
+            return routed
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            print(f"Failed to parse turn router response: {response_text}")
+            return None
+        except Exception as e:
+            print(f"Turn router call failed: {e}")
+            return None
+
+    def _resolve_target_city(self, target_city_name, original_city, target_coords=None):
+        """Geocode the requested city (unless already known) and fetch its landmarks (one dependent chain)."""
+        print(f"[Location Override] User wants to tour: {target_city_name}")
+        target_coords = target_coords or self.get_city_coordinates(target_city_name)
+        if not target_coords:
+            print(f"[Location Override] WARNING: Failed to geocode '{target_city_name}', using original location: {original_city}")
+            return None, None
+        # Override city with target city coordinates for search
+        city = {
+            'name': target_city_name,
+            'latitude': target_coords['lat'],
+            'longitude': target_coords['lng']
+        }
+        print(f"[Location Override] Successfully geocoded to: lat={city['latitude']}, lng={city['longitude']}")
+        return city, self.get_nearby_landmarks(city)
+
+    def _prepare_turn(self, query, metadata, first_request, session):
+        """
+        Everything before the main LLM call: classifiers, landmarks and lookups.
+        Returns the per-turn system prompt (language and additional info) and the
+        turn context (locations, landmarks and the possibly translated `new_query`).
+        """
+        turn_start = time.time()
         city = metadata.city.dict()
         original_city = city.copy()
-        
+
+        # Landmarks around the map center are needed unless the user asks for another
+        # city, so start fetching them right away instead of after the classifiers.
+        landmarks_future = self.executor.submit(self.get_nearby_landmarks, city)
+
+        if first_request:
+            # Reset conversation on first request to be safe
+            session.reset()
+
         # Detect City Change to clear context (Fix for "Stuck in Delhi" issue)
-        # We store the last city name in self.memory or a new attribute
+        # We store the last city name on the session
         current_city_name = city.get('name', '')
-        last_city_name = getattr(self, 'last_city_name', '')
+        last_city_name = session.last_city_name
         
         # If city name changes significantly (and neither is empty), clear conversation history
         if current_city_name and last_city_name and current_city_name != last_city_name:
             print(f"City changed from {last_city_name} to {current_city_name}. Clearing conversation history.")
-            self.conversation = []
-            
-        self.last_city_name = current_city_name
-
-        # Detect if user wants to tour a different city than their current location
-        target_city_info = self.detect_target_city(query)
-        if target_city_info.get('is_different_city') and target_city_info.get('target_city'):
-            target_city_name = target_city_info['target_city']
-            print(f"[Location Override] User wants to tour: {target_city_name}")
-            target_coords = self.get_city_coordinates(target_city_name)
-            if target_coords:
-                # Override city with target city coordinates for search
-                city = {
-                    'name': target_city_name,
-                    'latitude': target_coords['lat'],
-                    'longitude': target_coords['lng']
-                }
-                print(f"[Location Override] Successfully geocoded to: lat={city['latitude']}, lng={city['longitude']}")
+            session.reset()
+
+        session.last_city_name = current_city_name
+
+        conversation = history_messages(session)
+        routed = None
+        if Config.TURN_ROUTER_MODE:
+            routed = self.route_turn(query, conversation, first_request, session.language)
+
+        language_future = None
+        if routed:
+            query = routed['query']
+            if first_request:
+                language_future = _resolved_future(routed['language'])
+            target_city_future = _resolved_future(routed['target_city'])
+            seeking_future = _resolved_future(routed['location_seeking'])
+        else:
+            if first_request:
+                language_future = self.executor.submit(self.language_detection, query)
             else:
-                print(f"[Location Override] WARNING: Failed to geocode '{target_city_name}', using original location: {original_city}")
+                # Classifiers below work on the translated query, so this stays on the critical path
+                query = self.translate(query, session.language)
+            # Independent classifiers run concurrently
+            target_city_future = self.executor.submit(self.detect_target_city, query, conversation)
+            seeking_future = self.executor.submit(self.is_location_information_seeking, query, conversation)
+        # The general Wikipedia lookup only depends on the query, so fetch it speculatively
+        general_wikipedia_future = self.executor.submit(self.get_wikipedia_article, query)
+
+        # Dispatch each dependent lookup as soon as the classifier it needs returns
+        target_chain_future = None
+        location = None
+        for future in concurrent.futures.as_completed([target_city_future, seeking_future]):
+            if future is target_city_future:
+                target_city_info = future.result()
+                if target_city_info.get('is_different_city') and target_city_info.get('target_city'):
+                    target_chain_future = self.executor.submit(
+                        self._resolve_target_city, target_city_info['target_city'], original_city,
+                        target_city_info.get('coordinates')
+                    )
+                else:
+                    print(f"[Location] Using map center location: {city.get('name', 'Unknown')}")
+            else:
+                loc_info = future.result()
+                if loc_info['prediction']:
+                    location = loc_info['location']
+                    search_location_future = self.executor.submit(self.search_location, location)
+                    location_wikipedia_future = self.executor.submit(self.get_wikipedia_article, location)
+
+        landmarks = None
+        if target_chain_future:
+            target_city, target_landmarks = target_chain_future.result()
+            if target_city:
+                city, landmarks = target_city, target_landmarks
+        if landmarks is None:
+            landmarks = landmarks_future.result()
+        print(f"[Landmarks] Found {len(landmarks)} landmarks for location: {city.get('name', 'Unknown')}")
+        # Warm Wikipedia extracts for the landmarks while the main LLM call runs,
+        # so follow-up questions about them skip both Wikipedia round-trips
+        self.wikipedia.prefetch([
+            place['location']['displayName'].get('text', '')
+            for place in landmarks[:Config.WIKIPEDIA_PREFETCH_LIMIT]
+            if isinstance(place.get('location', {}).get('displayName'), dict)
+        ])
+
+        additional_info = {}
+        if location:
+            additional_info['location_info'] = {location: search_location_future.result()}
+            additional_info['location_info']['wikipedia'] = location_wikipedia_future.result()
         else:
-            print(f"[Location] Using map center location: {city.get('name', 'Unknown')}")
+            additional_info['general_info'] = {'wikipedia': general_wikipedia_future.result()}
 
-        # time to get the landmarks
-        start = time.time()
-        landmarks = self.get_nearby_landmarks(city)
-        end = time.time()
-        print(f"[Landmarks] Found {len(landmarks)} landmarks in {end-start:.2f}s for location: {city.get('name', 'Unknown')}")
-        # time to get the response
-        start = time.time()
-        new_message = {
-                "role": "user",
-                "content": json.dumps({
-                    "user_physical_location": original_city,
-                    "tour_search_location": city,
-                    "landmarks_for_tour_location": landmarks,
-                    "new_query": query
-                })
-            }
-        
-        loc_info = self.is_location_information_seeking(query)
+        if session.preferences:
+            additional_info['visitor_preferences'] = session.preferences
 
-        additional_info = {}
+        if language_future:
+            session.language = language_future.result()
+        print(f"[Timing] Turn context gathered in {time.time() - turn_start:.2f}s")
 
-        if loc_info['prediction']:
-            location = loc_info['location']
-            location_info = self.search_location(location)
-            additional_info['location_info'] = {location: location_info}
-            additional_info['location_info']['wikipedia'] = self.get_wikipedia_article(location)
-        else:
-            additional_info['general_info'] = {'wikipedia': self.get_wikipedia_article(query)}
-        new_system_prompt = {
-            "role": "system",
-            "content": self.system_prompt['content']
+        turn_context = {
+            "user_physical_location": original_city,
+            "tour_search_location": city,
+            "landmarks_for_tour_location": landmarks,
+            "new_query": query
         }
-        new_system_prompt['content'] = new_system_prompt['content'].format(additional_info=json.dumps(additional_info), language=self.language)
 
-            
+        # Only the per-turn part; the static instructions are attached to self.main_model
+        turn_prompt = f"RESPONSE LANGUAGE: {session.language}\n\nADDITIONAL INFORMATION:\n{json.dumps(additional_info)}"
+        return turn_prompt, turn_context
+
+    @staticmethod
+    def _main_output_format():
+        """Schema-constrained JSON for the main call (unless disabled with MAIN_RESPONSE_SCHEMA)."""
+        if not Config.MAIN_RESPONSE_SCHEMA:
+            return {}
+        return {"response_mime_type": "application/json", "response_schema": MAIN_RESPONSE_SCHEMA}
+
+    def _main_messages(self, session, system_prompt, turn_context):
+        """
+        Messages for the main call: summary, recent turns and the full context of
+        this turn only, kept within PROMPT_TOKEN_BUDGET.
+        """
+        summary_messages = history_messages(session)[:1] if session.summary else []
+        messages, tokens, trimmed = fit_to_budget(
+            self.static_system_prompt + system_prompt, summary_messages, session.conversation, turn_context, Config.PROMPT_TOKEN_BUDGET
+        )
+        growth = prompt_metrics.record(session, tokens, trimmed)
+        print(f"[Prompt] ~{tokens} tokens ({growth:+d} vs previous turn){' (trimmed to budget)' if trimmed else ''}")
+        return messages
+
+    def _parse_main_response(self, response_text):
+        """
+        Parses the main response, repairing truncated output and dropping
+        malformed locations instead of discarding the whole answer.
+        """
+        try:
+            parsed, repaired = parse_json(response_text)
+            if not isinstance(parsed, dict):
+                raise json.JSONDecodeError("Main response is not a JSON object", response_text or "", 0)
+        except json.JSONDecodeError:
+            print(f"Failed to parse main agent response: {response_text}")
+            self.response_parse_metrics.record("failed")
+            return {'locations': [], 'speech': FALLBACK_SPEECH}
+
+        locations = self._valid_locations(parsed.get('locations'))
+        dropped = len(parsed.get('locations') or []) - len(locations)
+        speech = parsed.get('speech')
+        if not isinstance(speech, str) or not speech.strip():
+            # Without speech the user only gets the apology, so the call was wasted
+            print(f"Main agent response has no speech: {response_text}")
+            self.response_parse_metrics.record("failed", dropped_items=dropped)
+            return {**parsed, 'locations': locations, 'speech': FALLBACK_SPEECH}
+        if repaired:
+            print(f"[Parse] Repaired truncated main response ({len(locations)} locations kept)")
+        self.response_parse_metrics.record("repaired" if repaired else "parsed", dropped_items=dropped)
+        return {**parsed, 'locations': locations, 'speech': speech}
+
+    @staticmethod
+    def _valid_locations(items):
+        locations = []
+        for item in items if isinstance(items, list) else []:
+            try:
+                locations.append(Location.parse_obj(item).dict())
+            except (pydantic.ValidationError, TypeError):
+                continue
+        return locations
+
+    def _record_turn(self, session, turn_context, response):
+        # Only the query goes into history; landmarks and locations are re-sent
+        # fresh with each turn rather than replayed from every earlier one
+        session.conversation.append({"role": "user", "content": turn_context["new_query"]})
+        session.conversation.append({"role": "assistant", "content": response['speech']})
+        # Preferences are inferred in the background after the response is sent
+        # (see update_session_preferences) and feed into the next turn.
+
+    def answer(self, query, metadata, first_request, session):
+        system_prompt, turn_context = self._prepare_turn(query, metadata, first_request, session)
 
         # Combine system prompt with conversation history and new message
-        all_messages = self.conversation + [new_message]
+        start = time.time()
+        all_messages = self._main_messages(session, system_prompt, turn_context)
         response_text = call_gemini(
-            model=self.client,
-            system_prompt=new_system_prompt['content'],
+            model=self.main_model,
+            system_prompt=system_prompt,
             messages=all_messages,
             temperature=0.7,
-            max_tokens=4000
+            max_tokens=4000,
+            **self._main_output_format()
         )
-        end = time.time()
-        try:
-            cleaned_text = extract_json_from_response(response_text)
-            response = json.loads(cleaned_text)
-            # Ensure response has required fields
-            if 'locations' not in response:
-                response['locations'] = []
-            if 'speech' not in response:
-                response['speech'] = "I apologize, I'm having trouble processing that request. Could you try asking again?"
-        except json.JSONDecodeError:
-            print(f"Failed to parse main agent response: {response_text}")
-            response = {
-                'locations': [],
-                'speech': "I apologize, I'm having trouble processing that request. Could you try asking again?"
-            }
-        
-        new_response = {
-            "role": "assistant",
-            "content": response['speech']
-        }
-        self.conversation.append(new_message)
-        self.conversation.append(new_response)
+        print(f"[Timing] Main response generated in {time.time() - start:.2f}s")
+        response = self._parse_main_response(response_text)
+        self._record_turn(session, turn_context, response)
 
-        try:
-            self.preferences = self.infer_user_preferences()
-        except Exception as e:
-            print(f"Failed to infer preferences: {e}")
-            pass
-        
         # Generate Audio with language-specific voice
         try:
-            audio_path = self.tts.generate_audio(response['speech'], language=self.language)
+            if Config.TTS_STREAMING_MODE:
+                # The client starts playback while ElevenLabs is still synthesizing
+                stream_id = self.tts.register_stream(response['speech'], language=session.language)
+                response['audio_url'] = f"/api/tts/stream/{stream_id}" if stream_id else None
+                return response
+            audio_path = self.tts.generate_audio(response['speech'], language=session.language)
             if audio_path:
-                response['audio_url'] = f"/audio/{os.path.basename(audio_path)}"
+                response['audio_url'] = media_cache.url_for(audio_path)
         except Exception as e:
             print(f"Failed to generate audio: {e}")
             response['audio_url'] = None
 
         return response
+
+    def answer_stream(self, query, metadata, first_request, session):
+        """
+        Streaming variant of `answer`. Yields events as the main response is generated:
+          {"type": "locations", "locations"} as soon as the locations array is complete,
+          {"type": "audio", "index", "text", "audio_url"} per sentence of speech, in order,
+          {"type": "response", ...} with the full parsed response at the end.
+        Each sentence is sent to TTS as soon as it is complete, so the first audio
+        is ready after the first sentence instead of after the whole answer.
+        """
+        system_prompt, turn_context = self._prepare_turn(query, metadata, first_request, session)
+
+        start = time.time()
+        all_messages = self._main_messages(session, system_prompt, turn_context)
+        extractor = SpeechFieldExtractor()
+        fields = JSONStreamParser()
+        splitter = SentenceSplitter()
+        segments = []  # (sentence, tts future) in speech order
+        audio_urls = []
+        emitted = 0
+        response_parts = []
+
+        def synthesize(sentences):
+            for sentence in sentences:
+                segments.append((sentence, self.executor.submit(self.tts.generate_audio, sentence, session.language)))
+
+        def ready_events(wait):
+            nonlocal emitted
+            while emitted < len(segments):
+                sentence, future = segments[emitted]
+                if not wait and not future.done():
+                    break
+                audio_path = None
+                try:
+                    audio_path = future.result()
+                except Exception as e:
+                    print(f"Failed to generate audio for segment {emitted}: {e}")
+                if emitted == 0:
+                    print(f"[Timing] First audio segment ready after {time.time() - start:.2f}s")
+                audio_url = media_cache.url_for(audio_path) if audio_path else None
+                if audio_url:
+                    audio_urls.append(audio_url)
+                yield {
+                    "type": "audio",
+                    "index": emitted,
+                    "text": sentence,
+                    "audio_url": audio_url
+                }
+                emitted += 1
+
+        for chunk in call_gemini_stream(
+            model=self.main_model,
+            system_prompt=system_prompt,
+            messages=all_messages,
+            temperature=0.7,
+            max_tokens=4000,
+            **self._main_output_format()
+        ):
+            response_parts.append(chunk)
+            synthesize(splitter.feed(extractor.feed(chunk)))
+            completed = fields.feed(chunk)
+            if 'locations' in completed:
+                # The map can show the route while the speech is still being generated
+                print(f"[Timing] Locations ready after {time.time() - start:.2f}s")
+                yield {"type": "locations", "locations": self._valid_locations(completed['locations'])}
+            yield from ready_events(wait=False)
+        synthesize(splitter.flush())
+        yield from ready_events(wait=True)
+
+        print(f"[Timing] Main response streamed in {time.time() - start:.2f}s")
+        response = self._parse_main_response("".join(response_parts))
+        self._record_turn(session, turn_context, response)
+        response['audio_url'] = None
+        response['audio_segments'] = audio_urls
+        yield {"type": "response", **response}
     
 
 
@@ -767,5 +1202,7 @@ if __name__ == "__main__":
     city = City(latitude=40.7128, longitude=-74.0060)
     metadata = MetaData(city=city, is_first_request=True)
 
-    response = agent.answer("What are some interesting places to visit in New York?", metadata=metadata)
+    from utils.session_store import SessionState
+    session = SessionState("local")
+    response = agent.answer("What are some interesting places to visit in New York?", metadata=metadata, first_request=True, session=session)
     print(response)
\ No newline at end of file
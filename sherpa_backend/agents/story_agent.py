@@ -2,20 +2,86 @@
 import os
 import json
 import base64
+import concurrent.futures
+import contextlib
+import hashlib
 import vertexai
 from vertexai.preview.vision_models import ImageGenerationModel
 from vertexai.generative_models import GenerativeModel
 from utils.config import Config
 from utils.tts import TTSManager
+from utils.rate_limiter import gemini_limiter, model_key
+from utils.single_flight import single_flight, atomic_write_path
+from utils.media_cache import media_cache
+from utils.story_cache import StoryCache
+from utils.image_variants import ImageVariantProcessor
 from dotenv import load_dotenv
 
 load_dotenv()
 
+STORY_PROMPT = """
+        Create a vivid, storytelling narration about {monument_name} in {location_context}.
+        It must be exactly {scene_count} short scene(s).
+        
+        For the scene, describe: The essence and majesty of this place - why it was built, what makes it special, and why it's worth visiting. Create an emotional connection.
+        
+        The goal is to deeply persuade the user to visit by connecting them to its creation and its present-day majesty.
+        Focus on emotion, grandeur, and human effort.
+        
+        For each scene, provide:
+        1. 'narration': The text to be spoken (keep it under 50 words for impact).
+        2. 'image_prompt': A detailed prompt to generate a photorealistic, cinematic image of the monument in its full glory.
+        
+        Output valid JSON format:
+        [
+            {{ "narration": "...", "image_prompt": "..." }}
+        ]
+        """
+IMAGE_PROMPT_SUFFIX = ", photorealistic, cinematic lighting, high quality, 4k"
+
+
+def story_cache_version():
+    """Fingerprint of everything that shapes a story; cached stories from other versions are ignored."""
+    parts = [
+        STORY_PROMPT, IMAGE_PROMPT_SUFFIX, Config.TEXT_MODEL, Config.IMAGE_GENERATION_MODEL,
+        str(Config.STORY_IMAGE_COUNT), Config.STORY_VOICE_ID,
+    ]
+    return hashlib.md5("\n".join(parts).encode()).hexdigest()[:12]
+
+
+def image_url_for(image_filename):
+    """Story images are served through /images, which picks a responsive variant."""
+    return f"/images/{image_filename}"
+
+
+# Shared WebP/AVIF variant encoder for generated story images
+image_variants = ImageVariantProcessor(
+    media_cache, Config.IMAGE_VARIANT_WIDTHS, max_workers=Config.IMAGE_VARIANT_WORKERS
+)
+
+
 class StoryAgent:
-    # In-memory cache for generated stories (persists during server runtime)
-    _story_cache = {}
+    # Generated stories, shared across instances and worker processes
+    story_cache = StoryCache(
+        Config.STORY_CACHE_PATH,
+        version=story_cache_version(),
+        ttl_seconds=Config.STORY_CACHE_TTL_SECONDS,
+        max_memory_entries=Config.STORY_CACHE_MAX_ENTRIES,
+    )
     
-    def __init__(self):
+    def __init__(self, upstream_limits=None, image_jobs=None):
+        """
+        Args:
+            upstream_limits: Optional {"gemini"|"imagen"|"elevenlabs": semaphore} capping
+                concurrent calls per upstream across all stories (used by batch pre-warming)
+            image_jobs: Optional JobQueue; when given, scene images are generated as
+                background jobs and stories return `image_job_id`s instead of waiting
+        """
+        self.upstream_limits = upstream_limits or {}
+        self.image_jobs = image_jobs
+        if image_jobs:
+            image_jobs.register("story_image", self._run_image_job)
+
         # Initialize Vertex AI for both text and images
         # Ensure project is set (re-using context if already initialized, but explicit is safer for independence)
         vertexai.init(project=Config.GCP_PROJECT_ID, location="us-central1")
@@ -35,69 +101,148 @@ class StoryAgent:
             self.image_gen_available = False
 
         self.tts = TTSManager()
+
+    def _limit(self, upstream):
+        """Context manager holding a slot of `upstream`'s concurrency limit (no-op without one)."""
+        return self.upstream_limits.get(upstream) or contextlib.nullcontext()
     
-    def _get_cache_key(self, monument_name):
-        """Generate a cache key from monument name"""
-        return "".join(x for x in monument_name if x.isalnum() or x in (' ', '_', '-')).strip().replace(' ', '_').lower()
-        
-    def _process_scene(self, scene, index, monument_name):
-        """Process a single scene: Generate Audio and Image"""
-        narration = scene.get('narration', '')
-        image_prompt = scene.get('image_prompt', '')
-        
-        scene_result = {
-            "text": narration,
-            "scene_index": index
-        }
-        
-        # Sanitize monument name for filenames (remove special chars)
-        safe_name = "".join(x for x in monument_name if x.isalnum() or x in (' ', '_', '-')).strip().replace(' ', '_')
+    def _get_cache_key(self, monument_name, location_context):
+        """
+        Cache key from the monument name and a hash of the location context the
+        story is written for. The prompt template and models are covered by the
+        cache version (story_cache_version).
+        """
+        name = "".join(x for x in monument_name if x.isalnum() or x in (' ', '_', '-')).strip().replace(' ', '_').lower()
+        context_hash = hashlib.md5((location_context or "").encode()).hexdigest()[:8]
+        return f"{name}_{context_hash}"
         
-        # Generate Audio
+    def _scene_audio(self, narration, index):
+        """Narration audio for one scene; returns its URL or None."""
         try:
-            audio_path = self.tts.generate_audio(
-                narration, 
-                voice_id=Config.STORY_VOICE_ID
-            )
+            with self._limit("elevenlabs"):
+                audio_path = self.tts.generate_audio(
+                    narration, 
+                    voice_id=Config.STORY_VOICE_ID
+                )
             if audio_path:
-                # Store absolute path usage or move if needed? 
-                # TTS saves to audio_cache by default.
-                # We need to ensure the filename is web-safe if we were naming it ourselves, 
-                # but TTSManager handles naming. We just need the basename.
-                scene_result["audio_url"] = f"/audio/{os.path.basename(audio_path)}"
+                # TTS saves into the shared media cache.
+                # TTSManager handles naming; the URL includes the shard directory.
+                return media_cache.url_for(audio_path)
         except Exception as e:
             print(f"Error generating audio for scene {index}: {e}")
+        return None
+
+    @staticmethod
+    def _image_filename(cache_key, index):
+        # The cache key is already sanitized and carries the location context hash,
+        # so same-named monuments in different places get their own images
+        return f"story_{cache_key}_{index}.png"
+
+    def _scene_image(self, image_prompt, index, cache_key):
+        """Image for one scene (only if configured and available); returns its URL or None."""
+        if not (self.image_gen_available and image_prompt):
+            return None
+
+        image_filename = self._image_filename(cache_key, index)
+        image_path = media_cache.path_for(image_filename)
         
-        # Generate Image (only if configured and available)
-        if self.image_gen_available and image_prompt:
-            image_filename = f"story_{safe_name}_{index}.png"
-            image_path = os.path.join("audio_cache", image_filename)
-            
-            # Check if image already exists on disk (disk cache)
-            if os.path.exists(image_path):
+        # Check if image already exists in the media cache index
+        def lookup():
+            if media_cache.lookup(image_filename, verify=True):
                 print(f"Image cache HIT for scene {index} - using existing image")
-                scene_result["image_url"] = f"/audio/{image_filename}"
-            else:
-                print(f"Image cache MISS - generating image for scene {index}...")
-                try:
-                    # Generate 1 image per scene
-                    images = self.image_model.generate_images(
-                        prompt=image_prompt + ", photorealistic, cinematic lighting, high quality, 4k",
-                        number_of_images=1,
-                        language="en",
-                        aspect_ratio="16:9",
-                        safety_filter_level="block_some",
-                        person_generation="allow_adult"
-                    )
-                    
-                    if images:
-                        images[0].save(location=image_path, include_generation_parameters=False)
-                        scene_result["image_url"] = f"/audio/{image_filename}"
-                        
-                except Exception as e:
-                    print(f"Error generating image for scene {index}: {e}")
+                return True
+            return None
+
+        # Concurrent requests for the same image share one Imagen call
+        if single_flight.do(
+            "image", image_filename,
+            lambda: self._generate_image(image_prompt, image_path, index),
+            lookup=lookup
+        ):
+            return image_url_for(image_filename)
+        return None
         
-        return scene_result
+    def _submit_image_job(self, image_prompt, index, cache_key):
+        """
+        Image for one scene in job mode: (image_url, None) when it is already
+        cached, otherwise (None, job_id) of a background generation job.
+        """
+        if not (self.image_gen_available and image_prompt):
+            return None, None
+        image_filename = self._image_filename(cache_key, index)
+        if media_cache.lookup(image_filename, verify=True):
+            return image_url_for(image_filename), None
+        job_id = self.image_jobs.submit(
+            "story_image", image_filename,
+            {"image_prompt": image_prompt, "image_filename": image_filename, "index": index}
+        )
+        return None, job_id
+
+    def _run_image_job(self, payload):
+        """JobQueue handler for "story_image" jobs; raises so failed attempts are retried."""
+        image_filename = payload["image_filename"]
+        generated = single_flight.do(
+            "image", image_filename,
+            lambda: self._generate_image(payload["image_prompt"], media_cache.path_for(image_filename), payload["index"]),
+            lookup=lambda: True if media_cache.lookup(image_filename, verify=True) else None
+        )
+        if not generated:
+            raise RuntimeError(f"Image generation failed for {image_filename}")
+        return {"image_url": image_url_for(image_filename)}
+
+    def _resolve_image_jobs(self, cache_key, scenes):
+        """
+        Fills in image URLs of finished jobs in a cached story and resubmits failed
+        ones (script and audio are kept). Returns updated copies of the scenes;
+        the cached ones are shared with concurrent requests and never modified.
+        """
+        if not self.image_jobs:
+            return scenes
+        scenes = [dict(scene) for scene in scenes]
+        changed = False
+        for scene in scenes:
+            job_id = scene.get("image_job_id")
+            if not job_id or scene.get("image_url"):
+                continue
+            job = self.image_jobs.get(job_id)
+            if job and job["status"] == "succeeded":
+                scene["image_url"] = job["result"]["image_url"]
+                del scene["image_job_id"]
+                changed = True
+            elif job is None or job["status"] == "failed":
+                print(f"Retrying failed image job {job_id}")
+                if job is None or self.image_jobs.retry(job_id) is None:
+                    del scene["image_job_id"]  # Job record is gone; the next generation redoes the image
+                    changed = True
+        if changed:
+            self.story_cache.put(cache_key, scenes)
+        return scenes
+
+    def _generate_image(self, image_prompt, image_path, index):
+        """Generates one image with Imagen and writes it atomically. Returns True on success."""
+        print(f"Image cache MISS - generating image for scene {index}...")
+        try:
+            # Generate 1 image per scene
+            with self._limit("imagen"):
+                images = self.image_model.generate_images(
+                    prompt=image_prompt + IMAGE_PROMPT_SUFFIX,
+                    number_of_images=1,
+                    language="en",
+                    aspect_ratio="16:9",
+                    safety_filter_level="block_some",
+                    person_generation="allow_adult"
+                )
+
+            if images:
+                with atomic_write_path(image_path) as tmp_path:
+                    images[0].save(location=str(tmp_path), include_generation_parameters=False)
+                media_cache.add(os.path.basename(image_path), "image")
+                image_variants.submit(os.path.basename(image_path))
+                return True
+
+        except Exception as e:
+            print(f"Error generating image for scene {index}: {e}")
+        return False
 
     def generate_story(self, monument_name, location_context):
         """
@@ -106,66 +251,155 @@ class StoryAgent:
         """
         
         # Check cache first for instant response
-        cache_key = self._get_cache_key(monument_name)
-        if cache_key in StoryAgent._story_cache:
-            print(f"Cache HIT for {monument_name} - returning cached story")
-            return StoryAgent._story_cache[cache_key]
-        
-        print(f"Cache MISS for {monument_name} - generating new story...")
-        
-        # 1. Generate Story Script
-        prompt = f"""
-        Create a vivid, storytelling narration about {monument_name} in {location_context}.
-        It must be exactly {Config.STORY_IMAGE_COUNT} short scene(s).
-        
-        For the scene, describe: The essence and majesty of this place - why it was built, what makes it special, and why it's worth visiting. Create an emotional connection.
-        
-        The goal is to deeply persuade the user to visit by connecting them to its creation and its present-day majesty.
-        Focus on emotion, grandeur, and human effort.
-        
-        For each scene, provide:
-        1. 'narration': The text to be spoken (keep it under 50 words for impact).
-        2. 'image_prompt': A detailed prompt to generate a photorealistic, cinematic image of the monument in its full glory.
-        
-        Output valid JSON format:
-        [
-            {{ "narration": "...", "image_prompt": "..." }}
-        ]
+        cache_key = self._get_cache_key(monument_name, location_context)
+
+        def lookup():
+            scenes = self.story_cache.get(cache_key)
+            if scenes is not None:
+                print(f"Cache HIT for {monument_name} - returning cached story")
+                scenes = self._resolve_image_jobs(cache_key, scenes)
+            return scenes
+
+        # Concurrent requests for the same monument share one generation
+        return single_flight.do(
+            "story", cache_key,
+            lambda: self._generate_story(monument_name, location_context, cache_key),
+            lookup=lookup
+        )
+
+    def _generate_story(self, monument_name, location_context, cache_key):
+        """Cache miss path of generate_story: script, then audio and images per scene."""
+        events = self._generate_story_events(monument_name, location_context, cache_key)
+        while True:
+            try:
+                next(events)
+            except StopIteration as stop:
+                return stop.value
+
+    def generate_story_stream(self, monument_name, location_context):
+        """
+        Progressive version of generate_story. Yields events as the story comes
+        together instead of waiting for every scene:
+          {"type": "script", "scenes": [{scene_index, text}]}  right after script generation
+          {"type": "audio", "scene_index", "audio_url"}        as each narration is synthesized
+          {"type": "image", "scene_index", "image_url"}        as each image is rendered
+          {"type": "done", "scenes": [...]}                     the same list generate_story returns
+        A cached story, or one generated meanwhile by a concurrent request (they
+        share one generation with generate_story), is replayed as script/audio/image
+        events at once. In image job mode the stream then waits for this process's
+        image jobs and pushes their results; images still pending elsewhere keep
+        their `image_job_id`.
         """
+        cache_key = self._get_cache_key(monument_name, location_context)
+
+        def lookup():
+            scenes = self.story_cache.get(cache_key)
+            if scenes is not None:
+                print(f"Cache HIT for {monument_name} - replaying cached story")
+                scenes = self._resolve_image_jobs(cache_key, scenes)
+            return scenes
+
+        scenes = yield from single_flight.stream(
+            "story", cache_key,
+            lambda: self._generate_story_events(monument_name, location_context, cache_key),
+            self._replay_story_events,
+            lookup=lookup
+        )
+        scenes = [dict(scene) for scene in scenes]  # Shared with coalesced requests
+        yield from self._image_job_events(cache_key, scenes)
+        yield {"type": "done", "scenes": scenes}
+
+    @staticmethod
+    def _replay_story_events(scenes):
+        yield {"type": "script", "scenes": [{"scene_index": s["scene_index"], "text": s["text"]} for s in scenes]}
+        for scene in scenes:
+            for field, event_type in (("audio_url", "audio"), ("image_url", "image")):
+                if scene.get(field):
+                    yield {"type": event_type, "scene_index": scene["scene_index"], field: scene[field]}
+            if scene.get("image_job_id") and not scene.get("image_url"):
+                yield {"type": "image_job", "scene_index": scene["scene_index"], "image_job_id": scene["image_job_id"]}
+
+    def _image_job_events(self, cache_key, scenes):
+        """Waits for the story's image jobs queued in this process, yielding an image event for each success."""
+        pending = [s for s in scenes if s.get("image_job_id") and not s.get("image_url")]
+        if not (self.image_jobs and pending):
+            return
+        for scene in pending:
+            job = self.image_jobs.wait(scene["image_job_id"], timeout=Config.IMAGE_JOB_WAIT_SECONDS)
+            if job and job["status"] == "succeeded":
+                scene["image_url"] = job["result"]["image_url"]
+                del scene["image_job_id"]
+                yield {"type": "image", "scene_index": scene["scene_index"], "image_url": scene["image_url"]}
+        self.story_cache.put(cache_key, scenes)
+
+    def _generate_script(self, monument_name, location_context):
+        """Story script from Gemini: a list of {narration, image_prompt}, or [] on failure."""
+        prompt = STORY_PROMPT.format(
+            monument_name=monument_name,
+            location_context=location_context,
+            scene_count=Config.STORY_IMAGE_COUNT
+        )
         
         print(f"Generating story script for {monument_name}...")
         try:
-            response = self.text_model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-            scenes_data = json.loads(response.text)
+            with self._limit("gemini"):
+                response = gemini_limiter.call(
+                    model_key(self.text_model),
+                    self.text_model.generate_content,
+                    prompt,
+                    generation_config={"response_mime_type": "application/json"}
+                )
+            return json.loads(response.text)
         except Exception as e:
             print(f"Error generating story script: {e}")
             return []
-            
-        # 2. Process all scenes in parallel
-        import concurrent.futures
+
+    def _generate_story_events(self, monument_name, location_context, cache_key):
+        """
+        Generates a story, yielding generate_story_stream events up to (not
+        including) "done", caches it and returns the scenes.
+        """
+        print(f"Cache MISS for {monument_name} - generating new story...")
         
-        # Limit to 5 workers (one per scene usually)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            # Map the helper function to the data
-            futures = [
-                executor.submit(self._process_scene, scene, index, monument_name)
-                for index, scene in enumerate(scenes_data)
-            ]
+        # 1. Generate Story Script
+        scenes_data = self._generate_script(monument_name, location_context)
+        final_scenes = [
+            {"text": scene.get('narration', ''), "scene_index": index}
+            for index, scene in enumerate(scenes_data)
+        ]
+        yield {"type": "script", "scenes": [dict(scene) for scene in final_scenes]}
             
-            # Retrieve results as they complete (order matters for the list though)
-            # We want to preserve order, so we iterate over futures in creation order
-            final_scenes = []
-            for future in futures:
+        # 2. Audio and images for all scenes in parallel, each reported as soon as it is ready
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(10, 2 * len(scenes_data)))) as executor:
+            futures = {}
+            for index, scene in enumerate(scenes_data):
+                futures[executor.submit(self._scene_audio, scene.get('narration', ''), index)] = (index, "audio_url")
+                if not self.image_jobs:
+                    futures[executor.submit(self._scene_image, scene.get('image_prompt', ''), index, cache_key)] = (index, "image_url")
+                    continue
+                # Images run as background jobs; the story doesn't wait for Imagen
+                image_url, job_id = self._submit_image_job(scene.get('image_prompt', ''), index, cache_key)
+                if image_url:
+                    final_scenes[index]["image_url"] = image_url
+                    yield {"type": "image", "scene_index": index, "image_url": image_url}
+                elif job_id:
+                    final_scenes[index]["image_job_id"] = job_id
+                    yield {"type": "image_job", "scene_index": index, "image_job_id": job_id}
+
+            for future in concurrent.futures.as_completed(futures):
+                index, field = futures[future]
                 try:
-                    final_scenes.append(future.result())
+                    url = future.result()
                 except Exception as e:
-                    print(f"Error processing scene future: {e}")
+                    print(f"Error processing scene {index} {field}: {e}")
+                    continue
+                if url:
+                    final_scenes[index][field] = url
+                    yield {"type": field[:-len("_url")], "scene_index": index, field: url}
         
-        # Cache the result for future requests
-        StoryAgent._story_cache[cache_key] = final_scenes
-        print(f"Cached story for {monument_name}")
-            
-        return final_scenes
-
-
+        # Cache the result for future requests (not an empty result from failed scenes)
+        if final_scenes:
+            self.story_cache.put(cache_key, final_scenes)
+            print(f"Cached story for {monument_name}")
 
+        return final_scenes
@@ -1,8 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
+import json
 from dotenv import load_dotenv
 from agents.city_walk_agent import CityWalkAgent, CityWalkResponse
+from utils.rate_limiter import gemini_limiter
+from utils.http_client import http_client
+from utils.single_flight import single_flight
+from utils.media_cache import media_cache
+from utils.media_server import media_response
+from utils.conversation import prompt_metrics, PromptMetrics
+from utils.language_id import language_identifier
+from utils.session_store import create_session_store
+from utils.task_queue import CoalescingTaskQueue
+from utils.config import Config
+from utils.concurrency import EndpointPool, EndpointOverloaded
 
 # 加载环境变量
 load_dotenv()
@@ -11,7 +25,6 @@ load_dotenv()
 
 app = FastAPI()
 
-from fastapi.staticfiles import StaticFiles
 import os
 
 app.add_middleware(
@@ -22,10 +35,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-os.makedirs("audio_cache", exist_ok=True)
-app.mount("/audio", StaticFiles(directory="audio_cache"), name="audio")
+@app.api_route("/audio/{shard}/{name}", methods=["GET", "HEAD"])
+def get_media(shard: str, name: str, request: Request):
+    """
+    Generated audio and images from the media cache (/audio/<shard>/<name>).
+    Content-addressed files are sent as immutable; ETag and Range requests are
+    answered from the cache index.
+    """
+    response = None
+    if shard == media_cache.shard_for(name) and not name.startswith("."):
+        response = media_response(media_cache, name, request.headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return response
 
 agent = CityWalkAgent()
+sessions = create_session_store()
+# Preference inference runs after the response; only the latest run per session is kept
+preference_queue = CoalescingTaskQueue(max_workers=Config.PREFERENCE_WORKERS, name="preferences")
+# Blocking agent work runs on per-endpoint thread pools so the event loop stays responsive
+answer_pool = EndpointPool("answer", Config.ANSWER_MAX_CONCURRENCY, Config.ANSWER_MAX_QUEUE)
+story_pool = EndpointPool("story", Config.STORY_MAX_CONCURRENCY, Config.STORY_MAX_QUEUE)
+
+def overloaded_error(e):
+    print(f"Rejecting request: {e}")
+    return HTTPException(status_code=503, detail="Server is busy, please retry shortly", headers={"Retry-After": "5"})
 
 class Landmark(BaseModel):
     name: str
@@ -45,25 +79,77 @@ class MetaData(BaseModel):
 def read_root():
     return {"status": "Sherpa Backend Running With no errors"}
 
+@app.get("/api/stats")
+def stats():
+    """
+    Runtime counters for latency troubleshooting.
+    """
+    return {
+        "gemini_rate_limiter": gemini_limiter.stats(),
+        "sessions": sessions.stats(),
+        "prompts": prompt_metrics.stats(),
+        "preference_queue": preference_queue.stats(),
+        "answer_pool": answer_pool.stats(),
+        "story_pool": story_pool.stats(),
+        "http": http_client.stats(),
+        "landmark_cache": agent.landmark_cache.stats() if agent.landmark_cache else None,
+        "geocode_cache": agent.geocode_cache.stats(),
+        "gazetteer": agent.gazetteer.stats() if agent.gazetteer else None,
+        "wikipedia_cache": agent.wikipedia.stats(),
+        "tts": agent.tts.stats(),
+        "language_id": language_identifier.stats(),
+        "main_response_parse": agent.response_parse_metrics.stats(),
+        "single_flight": single_flight.stats(),
+        "media_cache": media_cache.stats(),
+        "story_cache": story_agent.story_cache.stats(),
+        "image_jobs": image_jobs.stats() if image_jobs else None,
+        "image_variants": image_variants.stats(),
+    }
+
+@app.get("/api/sessions/{session_id}/prompt_stats")
+def session_prompt_stats(session_id: str):
+    """Main-prompt size per turn for one session, to spot conversations whose prompts keep growing."""
+    session = sessions.get(session_id)
+    with session.lock:
+        return PromptMetrics.session_stats(session)
+
+def run_answer_turn(query, metadata, session_id):
+    """Blocking part of /answer; runs on answer_pool."""
+    session = sessions.get(session_id)
+    with session.lock:
+        if metadata.is_first_request:
+            session.reset()
+        response = agent.answer(query, metadata, metadata.is_first_request, session)
+        sessions.save(session)
+    return response
+
 @app.post("/answer", response_model=CityWalkResponse)
-async def answer(query: str, metadata: MetaData = None) -> CityWalkResponse:
+async def answer(query: str, background_tasks: BackgroundTasks, metadata: MetaData = None, session_id: Optional[str] = None) -> CityWalkResponse:
     """
     调用CityWalkAgent回答问题
+    Each client keeps its own conversation via `session_id`; a new id is issued
+    when none is provided and returned in the response.
     """
+    session_id = session_id or sessions.new_session_id()
     try:
-        if metadata.is_first_request:
-            agent.conversation_reset()
-        response = agent.answer(query, metadata, metadata.is_first_request)
+        response = await answer_pool.run(run_answer_turn, query, metadata, session_id)
+        background_tasks.add_task(
+            preference_queue.submit, session_id, agent.update_session_background, sessions, session_id
+        )
         
         # Ensure we got a valid response
         if response is None or not isinstance(response, dict):
             print(f"Agent returned invalid response: {response}")
             return {
                 'locations': [],
-                'speech': "I apologize, I'm having technical difficulties. Please try again."
+                'speech': "I apologize, I'm having technical difficulties. Please try again.",
+                'session_id': session_id
             }
         
+        response['session_id'] = session_id
         return response
+    except EndpointOverloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         print(f"Error talking to agent: {str(e)}")
         import traceback
@@ -71,12 +157,85 @@ async def answer(query: str, metadata: MetaData = None) -> CityWalkResponse:
         # Return a valid response instead of HTTPException
         return {
             'locations': [],
-            'speech': "I apologize, I'm experiencing some technical issues. Could you please try asking your question again?"
+            'speech': "I apologize, I'm experiencing some technical issues. Could you please try asking your question again?",
+            'session_id': session_id
         }
 
+@app.get("/api/tts/stream/{stream_id}")
+def stream_tts(stream_id: str):
+    """
+    Streams speech audio with chunked transfer while ElevenLabs synthesizes it.
+    Cached audio is served straight from disk.
+    """
+    chunks = agent.tts.open_stream(stream_id)
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired audio stream")
+    return StreamingResponse(chunks, media_type="audio/mpeg")
+
+def run_answer_stream(query, metadata, session_id):
+    """Blocking generator behind /answer/stream; runs on one answer_pool thread."""
+    session = sessions.get(session_id)
+    with session.lock:
+        if metadata.is_first_request:
+            session.reset()
+        for event in agent.answer_stream(query, metadata, metadata.is_first_request, session):
+            if event["type"] == "response":
+                sessions.save(session)
+                event["session_id"] = session_id
+            yield event
+
+def sse_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@app.post("/answer/stream")
+async def answer_stream(query: str, background_tasks: BackgroundTasks, metadata: MetaData = None, session_id: Optional[str] = None):
+    """
+    Server-Sent Events version of /answer. Emits a `locations` event as soon as the
+    recommended locations are generated, an `audio` event per sentence of speech
+    (in order, as soon as its TTS is ready) and a final `response` event with the
+    full answer, so playback can start after the first sentence.
+    """
+    session_id = session_id or sessions.new_session_id()
+    try:
+        events = answer_pool.stream(run_answer_stream, query, metadata, session_id)
+    except EndpointOverloaded as e:
+        raise overloaded_error(e)
+
+    def event_source():
+        try:
+            for event in events:
+                yield sse_event(event)
+        except Exception as e:
+            print(f"Error streaming answer: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield sse_event({
+                'type': 'error',
+                'speech': "I apologize, I'm experiencing some technical issues. Could you please try asking your question again?",
+                'session_id': session_id
+            })
+
+    background_tasks.add_task(
+        preference_queue.submit, session_id, agent.update_session_background, sessions, session_id
+    )
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks
+    )
+
 # Story Mode Endpoint
-from agents.story_agent import StoryAgent
-story_agent = StoryAgent()
+from agents.story_agent import StoryAgent, image_variants
+from utils.job_queue import JobQueue
+image_jobs = JobQueue(
+    Config.IMAGE_JOB_STORE_PATH,
+    name="image",
+    max_workers=Config.IMAGE_JOB_WORKERS,
+    max_attempts=Config.IMAGE_JOB_MAX_ATTEMPTS,
+    stale_seconds=Config.IMAGE_JOB_STALE_SECONDS,
+) if Config.STORY_IMAGE_JOBS else None
+story_agent = StoryAgent(image_jobs=image_jobs)
 
 class StoryRequest(BaseModel):
     monument_name: str
@@ -86,6 +245,8 @@ class StoryRequest(BaseModel):
 async def generate_story(request: StoryRequest):
     """
     Generates a story with images and audio for a monument.
+    With STORY_IMAGE_JOBS, scenes whose image is still rendering carry an
+    `image_job_id` to poll at /api/jobs/{id} instead of an `image_url`.
     """
     print(f"Received story request for: {request.monument_name}")
     try:
@@ -93,8 +254,12 @@ async def generate_story(request: StoryRequest):
             print("Story Agent not initialized properly.")
             raise HTTPException(status_code=503, detail="Story feature unavailable")
             
-        scenes = story_agent.generate_story(request.monument_name, request.location_context)
+        scenes = await story_pool.run(story_agent.generate_story, request.monument_name, request.location_context)
         return {"scenes": scenes}
+    except HTTPException:
+        raise
+    except EndpointOverloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         print(f"Error generating story: {e}")
         import traceback
@@ -104,6 +269,72 @@ async def generate_story(request: StoryRequest):
         # The try-except here ensures that.
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/generate_story/stream")
+async def generate_story_stream(request: StoryRequest):
+    """
+    Server-Sent Events version of /api/generate_story. Emits a `script` event with
+    the scene texts as soon as the script exists, then `audio` and `image` events
+    per scene as they finish, and a final `done` event with the full scene list.
+    """
+    print(f"Received streaming story request for: {request.monument_name}")
+    try:
+        events = story_pool.stream(story_agent.generate_story_stream, request.monument_name, request.location_context)
+    except EndpointOverloaded as e:
+        raise overloaded_error(e)
+
+    def event_source():
+        try:
+            for event in events:
+                yield sse_event(event)
+        except Exception as e:
+            print(f"Error streaming story: {e}")
+            import traceback
+            traceback.print_exc()
+            yield sse_event({'type': 'error', 'detail': str(e)})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/images/{image_name}")
+def get_image(image_name: str, request: Request, w: Optional[int] = None):
+    """
+    Serves a story image in the best variant for the client: AVIF or WebP when
+    the `Accept` header allows it, resized to cover `w` pixels (`w<=32` returns
+    the blurred placeholder). Falls back to the original PNG.
+    """
+    response = None
+    if "/" not in image_name and not image_name.startswith("."):
+        selected = image_variants.select(image_name, request.headers.get("accept", ""), w)
+        if selected:
+            path, media_type = selected
+            # Better variants may appear once encoding finishes, so this is not cached as immutable
+            response = media_response(
+                media_cache, path.name, request.headers,
+                media_type=media_type, cache_control="public, max-age=3600", vary="Accept"
+            )
+    if response is None:
+        raise HTTPException(status_code=404, detail="Unknown image")
+    return response
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status of a background job: queued, running, succeeded (with `result`) or failed (with `error`)."""
+    job = image_jobs.get(job_id) if image_jobs else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.post("/api/jobs/{job_id}/retry")
+def retry_job(job_id: str):
+    """Resubmits a failed job without regenerating anything else."""
+    job = image_jobs.retry(job_id) if image_jobs else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
 if __name__ == "__main__":
     import uvicorn
     import os
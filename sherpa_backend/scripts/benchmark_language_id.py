@@ -0,0 +1,117 @@
+"""
+Accuracy and latency of the on-box language identifier (utils/language_id) on
+labelled queries that are not in its training samples, and how many of them
+would still fall back to the Gemini language_detection call.
+
+Usage: python scripts/benchmark_language_id.py [rounds] [--llm]
+       --llm also times CityWalkAgent.language_detection on the same queries.
+"""
+import os
+import statistics
+import sys
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.config import Config
+from utils.language_id import LanguageIdentifier
+
+QUERIES = [
+    ("Hi, I'd love to explore the waterfront and grab some seafood.", "English"),
+    ("Which monuments here were built during the colonial period?", "English"),
+    ("Take me somewhere my kids will enjoy, maybe a zoo or an aquarium.", "English"),
+    ("Is the fort open on Mondays?", "English"),
+    ("I'm not really into shopping, what else is there?", "English"),
+    ("Hola, ¿qué puedo ver en Madrid?", "Spanish"),
+    ("Quiero conocer los barrios más auténticos de la ciudad.", "Spanish"),
+    ("¿Dónde está el mejor sitio para comer tapas?", "Spanish"),
+    ("Me encantan las iglesias góticas y los jardines.", "Spanish"),
+    ("¿Está lejos el museo desde aquí?", "Spanish"),
+    ("Je voudrais découvrir les ruelles du quartier médiéval.", "French"),
+    ("Où est-ce qu'on peut manger une bonne crêpe ?", "French"),
+    ("Est-ce que le musée est ouvert le dimanche ?", "French"),
+    ("Nous aimons les jardins et les vieilles églises.", "French"),
+    ("Qu'est-ce qu'il y a à voir autour de la gare ?", "French"),
+    ("Ich möchte heute die schönsten Kirchen der Stadt sehen.", "German"),
+    ("Wo kann man hier gut und günstig essen?", "German"),
+    ("Ist das Museum am Montag geöffnet?", "German"),
+    ("Wir haben nur zwei Stunden Zeit, was lohnt sich?", "German"),
+    ("Zeig mir bitte den Weg zum Hafen.", "German"),
+    ("Vorrei visitare le chiese più belle della città.", "Italian"),
+    ("Dove si mangia la pizza migliore in questa zona?", "Italian"),
+    ("Il museo è aperto anche la domenica?", "Italian"),
+    ("Abbiamo solo due ore, cosa ci consigli di vedere?", "Italian"),
+    ("Mi piacciono molto i giardini e le fontane.", "Italian"),
+    ("Eu quero conhecer os bairros mais antigos da cidade.", "Portuguese"),
+    ("Onde posso comer um bom pastel de nata por aqui?", "Portuguese"),
+    ("O museu abre aos domingos?", "Portuguese"),
+    ("Temos só duas horas, o que vale a pena ver?", "Portuguese"),
+    ("Gostamos muito de praças e igrejas antigas.", "Portuguese"),
+    ("パリでおすすめの場所は？", "Japanese"),
+    ("京都の古いお寺を見たいです", "Japanese"),
+    ("서울에서 가볼 만한 곳을 추천해 주세요", "Korean"),
+    ("이 궁전의 역사에 대해 알려 주세요", "Korean"),
+    ("北京有什么值得参观的地方？", "Chinese"),
+    ("请告诉我这座寺庙的历史", "Chinese"),
+    ("ما هي أفضل الأماكن لزيارتها في القاهرة؟", "Arabic"),
+    ("أخبرني عن تاريخ هذا المسجد", "Arabic"),
+    ("Что интересного можно посмотреть в Москве?", "Russian"),
+    ("Расскажи мне историю этого собора", "Russian"),
+    ("दिल्ली में घूमने के लिए सबसे अच्छी जगहें कौन सी हैं?", "Hindi"),
+    ("मुझे इस किले का इतिहास बताइए", "Hindi"),
+]
+
+
+def benchmark(identify, rounds):
+    latencies_us = []
+    correct = 0
+    confident = 0
+    confident_correct = 0
+    for round_number in range(rounds):
+        for query, expected in QUERIES:
+            start = time.perf_counter()
+            language, confidence = identify(query)
+            latencies_us.append((time.perf_counter() - start) * 1e6)
+            if round_number:
+                continue
+            ok = language.lower() == expected.lower()
+            correct += ok
+            if confidence >= Config.LANGUAGE_ID_MIN_CONFIDENCE:
+                confident += 1
+                confident_correct += ok
+            else:
+                print(f"  low confidence ({confidence:.2f} {language}): {query}")
+            if not ok:
+                print(f"  wrong: {query!r} -> {language} ({confidence:.2f}), expected {expected}")
+    latencies_us.sort()
+    return {
+        "accuracy": correct / len(QUERIES),
+        "accuracy_when_confident": confident_correct / confident if confident else 0.0,
+        "llm_fallback_rate": 1 - confident / len(QUERIES),
+        "p50_us": statistics.median(latencies_us),
+        "p95_us": latencies_us[int(len(latencies_us) * 0.95) - 1],
+        "mean_us": statistics.mean(latencies_us),
+    }
+
+
+def print_results(name, r):
+    print(f"\n{name}: accuracy {r['accuracy']:.1%}, accuracy above threshold {r['accuracy_when_confident']:.1%}, "
+          f"LLM fallback {r['llm_fallback_rate']:.1%}")
+    print(f"  latency per call: p50 {r['p50_us']:.1f} us, p95 {r['p95_us']:.1f} us, mean {r['mean_us']:.1f} us")
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 200
+
+    start = time.perf_counter()
+    identifier = LanguageIdentifier(Config.LANGUAGE_PROFILES_PATH, Config.LANGUAGE_ID_MIN_CONFIDENCE)
+    print(f"Profiles loaded in {(time.perf_counter() - start) * 1e3:.1f} ms")
+    print_results("local identifier", benchmark(identifier.identify, rounds))
+
+    if "--llm" in sys.argv:
+        from dotenv import load_dotenv
+        load_dotenv()
+        from agents.city_walk_agent import CityWalkAgent
+        agent = CityWalkAgent()
+        print_results("Gemini language_detection", benchmark(lambda q: (agent.language_detection_llm(q), 1.0), 1))
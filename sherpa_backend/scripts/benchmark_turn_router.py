@@ -0,0 +1,103 @@
+"""
+Compares the single structured turn-router call with the per-function classifiers
+(language_detection/translate + detect_target_city + is_location_information_seeking).
+Reports wall-clock latency, number of Gemini calls and token usage per turn.
+
+Usage: python scripts/benchmark_turn_router.py [rounds]
+"""
+import os
+import sys
+import time
+import statistics
+from dotenv import load_dotenv
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.city_walk_agent import CityWalkAgent
+
+QUERIES = [
+    ("Hola, ¿qué puedo ver en Madrid?", True, "English"),
+    ("I want to tour Hyderabad", False, "English"),
+    ("Tell me about the history of the Red Fort", False, "English"),
+    ("What are the best places to visit around here?", False, "English"),
+    ("パリでおすすめの場所は？", False, "Japanese"),
+]
+
+CONVERSATION = [
+    {"role": "user", "content": "Hi, I like museums and quiet parks."},
+    {"role": "assistant", "content": "Great! Which city would you like to explore?"},
+]
+
+
+class UsageRecorder:
+    """Wraps a GenerativeModel and accumulates call count and token usage."""
+
+    def __init__(self, model):
+        self.model = model
+        self._model_name = getattr(model, "_model_name", None)
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def generate_content(self, *args, **kwargs):
+        response = self.model.generate_content(*args, **kwargs)
+        self.calls += 1
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.prompt_tokens += usage.prompt_token_count or 0
+            self.output_tokens += usage.candidates_token_count or 0
+        return response
+
+
+def run_classifiers(agent, query, first_request, language):
+    if first_request:
+        agent.language_detection(query)
+    else:
+        query = agent.translate(query, language)
+    agent.detect_target_city(query, CONVERSATION)
+    agent.is_location_information_seeking(query, CONVERSATION)
+
+
+def run_router(agent, query, first_request, language):
+    agent.route_turn(query, CONVERSATION, first_request, language)
+
+
+def benchmark(agent, recorder, fn, rounds):
+    latencies = []
+    recorder.reset()
+    for _ in range(rounds):
+        for query, first_request, language in QUERIES:
+            start = time.perf_counter()
+            fn(agent, query, first_request, language)
+            latencies.append(time.perf_counter() - start)
+    turns = len(latencies)
+    return {
+        "p50_s": statistics.median(latencies),
+        "mean_s": statistics.mean(latencies),
+        "max_s": max(latencies),
+        "calls_per_turn": recorder.calls / turns,
+        "prompt_tokens_per_turn": recorder.prompt_tokens / turns,
+        "output_tokens_per_turn": recorder.output_tokens / turns,
+    }
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    agent = CityWalkAgent()
+    recorder = UsageRecorder(agent.client)
+    agent.client = recorder
+
+    results = {
+        "per-function classifiers": benchmark(agent, recorder, run_classifiers, rounds),
+        "turn router": benchmark(agent, recorder, run_router, rounds),
+    }
+
+    print(f"\n{'path':<26}{'p50 s':>8}{'mean s':>8}{'max s':>8}{'calls':>7}{'in tok':>9}{'out tok':>9}")
+    for name, r in results.items():
+        print(f"{name:<26}{r['p50_s']:>8.2f}{r['mean_s']:>8.2f}{r['max_s']:>8.2f}"
+              f"{r['calls_per_turn']:>7.1f}{r['prompt_tokens_per_turn']:>9.0f}{r['output_tokens_per_turn']:>9.0f}")
@@ -0,0 +1,103 @@
+"""
+Builds the memory-mapped city gazetteer used by utils/gazetteer.Gazetteer.
+
+The default input is the bundled data/world_cities.tsv (name, country, latitude,
+longitude, population, |-separated aliases). A GeoNames dump can be used instead
+for full coverage, e.g. cities15000.txt from https://download.geonames.org/export/dump/
+(with countryInfo.txt for country names); its alternate names become aliases.
+
+Usage: python scripts/build_gazetteer.py [--tsv cities.tsv | --geonames cities15000.txt
+           [--country-info countryInfo.txt]] [--min-population N] [--output data/gazetteer.bin]
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.gazetteer import Gazetteer, build_gazetteer
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+SAMPLE_QUERIES = [
+    "I want to tour Hyderabad",
+    "What can I see in Rio de Janeiro this weekend?",
+    "Hola, ¿qué puedo ver en Nueva York?",
+    "Tell me about the history of the Red Fort and the old bazaars around it",
+    "東京でおすすめの場所は？",
+    "What are the best places to visit around here?",
+]
+
+csv.field_size_limit(sys.maxsize)
+
+
+def read_tsv(path):
+    cities = []
+    with open(path, encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t"):
+            if not row or row[0].startswith("#"):
+                continue
+            name, country, lat, lng, population = row[:5]
+            aliases = row[5].split("|") if len(row) > 5 and row[5] else []
+            cities.append({
+                "name": name, "country": country, "lat": float(lat), "lng": float(lng),
+                "population": int(population), "aliases": aliases,
+            })
+    return cities
+
+
+def read_geonames(path, country_info_path=None, min_population=0):
+    countries = {}
+    if country_info_path:
+        with open(country_info_path, encoding="utf-8") as f:
+            for row in csv.reader(f, delimiter="\t"):
+                if row and not row[0].startswith("#"):
+                    countries[row[0]] = row[4]
+    cities = []
+    with open(path, encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            population = int(row[14] or 0)
+            if population < min_population:
+                continue
+            cities.append({
+                "name": row[1], "country": countries.get(row[8], row[8]),
+                "lat": float(row[4]), "lng": float(row[5]), "population": population,
+                "aliases": [row[2]] + [a for a in row[3].split(",") if a],
+            })
+    return cities
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tsv", default=os.path.join(DATA_DIR, "world_cities.tsv"))
+    parser.add_argument("--geonames", help="GeoNames cities dump (takes precedence over --tsv)")
+    parser.add_argument("--country-info", help="GeoNames countryInfo.txt for country names")
+    parser.add_argument("--min-population", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(DATA_DIR, "gazetteer.bin"))
+    args = parser.parse_args()
+
+    if args.geonames:
+        cities = read_geonames(args.geonames, args.country_info, args.min_population)
+    else:
+        cities = [c for c in read_tsv(args.tsv) if c["population"] >= args.min_population]
+    start = time.perf_counter()
+    city_count, alias_count = build_gazetteer(cities, args.output)
+    print(f"Wrote {args.output}: {city_count} cities, {alias_count} aliases, "
+          f"{os.path.getsize(args.output) / 1024:.0f} KB in {time.perf_counter() - start:.1f}s")
+
+    # Sanity check of matching latency on the new file
+    gazetteer = Gazetteer(args.output)
+    latencies_us = []
+    for _ in range(200):
+        for query in SAMPLE_QUERIES:
+            started = time.perf_counter()
+            gazetteer.find_cities(query)
+            latencies_us.append((time.perf_counter() - started) * 1e6)
+    for query in SAMPLE_QUERIES:
+        print(f"  {query!r} -> {[m['name'] for m in gazetteer.find_cities(query)]}")
+    latencies_us.sort()
+    print(f"Matching: p50 {statistics.median(latencies_us):.0f} us, "
+          f"p99 {latencies_us[int(len(latencies_us) * 0.99)]:.0f} us per query")
@@ -0,0 +1,27 @@
+"""
+Builds the character n-gram profiles used by utils/language_id.LanguageIdentifier
+from labelled sample sentences. Re-run after editing the samples.
+
+Usage: python scripts/build_language_profiles.py [samples.json] [profiles.json]
+"""
+import json
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.language_id import build_profiles
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+if __name__ == "__main__":
+    samples_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(DATA_DIR, "language_samples.json")
+    profiles_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(DATA_DIR, "language_profiles.json")
+    with open(samples_path, encoding="utf-8") as f:
+        samples = json.load(f)
+    profiles = build_profiles(samples)
+    with open(profiles_path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    sizes = {language: len(profile["ngrams"]) for language, profile in profiles["profiles"].items()}
+    print(f"Wrote {profiles_path}: {sizes} ({os.path.getsize(profiles_path) / 1024:.0f} KB)")
@@ -0,0 +1,81 @@
+"""
+Fires concurrent requests at a running backend and reports whether they overlap.
+If the endpoints blocked the event loop, wall time would approach the sum of the
+request latencies; with the endpoint pools it should approach the slowest one.
+
+Usage: python scripts/load_test_endpoints.py [answer|story] [concurrency] [base_url]
+"""
+import sys
+import time
+import threading
+import requests
+
+ENDPOINT = sys.argv[1] if len(sys.argv) > 1 else "answer"
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+BASE_URL = sys.argv[3] if len(sys.argv) > 3 else "http://localhost:8000"
+
+
+def send_answer(index):
+    return requests.post(
+        f"{BASE_URL}/answer",
+        params={"query": "What are the top places to visit?", "session_id": f"loadtest-{index}"},
+        json={
+            "city": {"name": "New York", "latitude": 40.7128, "longitude": -74.0060},
+            "is_first_request": True
+        },
+        timeout=300
+    )
+
+
+def send_story(index):
+    return requests.post(
+        f"{BASE_URL}/api/generate_story",
+        json={"monument_name": "Eiffel Tower", "location_context": "Paris, France"},
+        timeout=300
+    )
+
+
+def main():
+    send = send_answer if ENDPOINT == "answer" else send_story
+    results = [None] * CONCURRENCY
+
+    def worker(index):
+        start = time.perf_counter()
+        try:
+            status = send(index).status_code
+        except Exception as e:
+            status = f"error: {e}"
+        results[index] = (start, time.perf_counter(), status)
+
+    print(f"Sending {CONCURRENCY} concurrent '{ENDPOINT}' requests to {BASE_URL}...")
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(CONCURRENCY)]
+    wall_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    # Probe the event loop while the heavy requests are in flight
+    probe_start = time.perf_counter()
+    requests.get(f"{BASE_URL}/", timeout=30)
+    probe_latency = time.perf_counter() - probe_start
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+
+    latencies = [end - start for start, end, _ in results]
+    # Peak number of requests that were in flight at the same moment
+    events = sorted([(start, 1) for start, _, _ in results] + [(end, -1) for _, end, _ in results])
+    in_flight = peak = 0
+    for _, delta in events:
+        in_flight += delta
+        peak = max(peak, in_flight)
+
+    for index, (start, end, status) in enumerate(results):
+        print(f"  #{index:<3} start +{start - wall_start:6.2f}s  end +{end - wall_start:6.2f}s  status {status}")
+    print(f"Wall time:            {wall:.2f}s")
+    print(f"Sum of latencies:     {sum(latencies):.2f}s")
+    print(f"Slowest request:      {max(latencies):.2f}s")
+    print(f"Peak overlap:         {peak} requests")
+    print(f"Health probe latency: {probe_latency * 1000:.0f}ms (event loop responsiveness)")
+
+
+if __name__ == "__main__":
+    main()
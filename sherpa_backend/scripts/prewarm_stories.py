@@ -0,0 +1,160 @@
+"""
+Pre-generates stories for a list of monuments so the persistent story and media
+caches are warm before users ask (run at deploy time).
+
+Input is a JSON list of {"monument_name", "location_context"} objects or a CSV
+with those two columns. Each story runs the normal StoryAgent.generate_story
+path; Gemini, Imagen and ElevenLabs calls are capped separately across all
+stories in flight. Finished entries are appended to a progress file, so an
+interrupted run can be restarted and skips what is already done.
+
+Usage: python scripts/prewarm_stories.py [monuments.json|.csv] [--stories 4]
+           [--gemini 4] [--imagen 2] [--elevenlabs 4] [--progress path] [--limit N]
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.story_agent import StoryAgent
+from utils.rate_limiter import gemini_limiter
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(__file__), "..", "data", "popular_monuments.json")
+DEFAULT_PROGRESS = os.path.join("story_cache", "prewarm_progress.jsonl")
+
+
+def load_monuments(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = [row for row in csv.DictReader(f)]
+        else:
+            rows = json.load(f)
+    return [
+        (row["monument_name"].strip(), row.get("location_context", "").strip())
+        for row in rows if row.get("monument_name", "").strip()
+    ]
+
+
+def load_completed(progress_path):
+    """Cache keys recorded as finished by earlier runs."""
+    completed = set()
+    if os.path.exists(progress_path):
+        with open(progress_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from an interrupted run
+                if record.get("status") == "ok":
+                    completed.add(record["key"])
+    return completed
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate stories for popular monuments.")
+    parser.add_argument("input", nargs="?", default=DEFAULT_INPUT)
+    parser.add_argument("--stories", type=int, default=4, help="Stories generated concurrently")
+    parser.add_argument("--gemini", type=int, default=4, help="Concurrent Gemini script calls")
+    parser.add_argument("--imagen", type=int, default=2, help="Concurrent Imagen calls")
+    parser.add_argument("--elevenlabs", type=int, default=4, help="Concurrent ElevenLabs calls")
+    parser.add_argument("--progress", default=DEFAULT_PROGRESS, help="Progress file used for resuming")
+    parser.add_argument("--limit", type=int, default=None, help="Only process the first N monuments")
+    args = parser.parse_args()
+
+    agent = StoryAgent(upstream_limits={
+        "gemini": threading.BoundedSemaphore(args.gemini),
+        "imagen": threading.BoundedSemaphore(args.imagen),
+        "elevenlabs": threading.BoundedSemaphore(args.elevenlabs),
+    })
+
+    monuments = load_monuments(args.input)[:args.limit]
+    completed = load_completed(args.progress)
+    os.makedirs(os.path.dirname(args.progress) or ".", exist_ok=True)
+    progress_lock = threading.Lock()
+    counts = {"generated": 0, "cached": 0, "skipped": 0, "failed": 0}
+    durations = []
+    failures = []
+
+    todo = []
+    for monument_name, location_context in monuments:
+        key = agent._get_cache_key(monument_name, location_context)
+        if key in completed:
+            counts["skipped"] += 1
+        else:
+            todo.append((key, monument_name, location_context))
+
+    def record(key, monument_name, status, seconds, scenes=0, error=None):
+        with progress_lock:
+            with open(args.progress, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "key": key, "monument_name": monument_name, "status": status,
+                    "scenes": scenes, "seconds": round(seconds, 2), "error": error,
+                }) + "\n")
+
+    def warm(key, monument_name, location_context):
+        was_cached = agent.story_cache.get(key) is not None
+        start = time.perf_counter()
+        try:
+            scenes = agent.generate_story(monument_name, location_context)
+        except Exception as e:
+            return key, monument_name, "failed", time.perf_counter() - start, 0, str(e)
+        seconds = time.perf_counter() - start
+        if not scenes:
+            return key, monument_name, "failed", seconds, 0, "no scenes generated"
+        missing = [s["scene_index"] for s in scenes
+                   if "audio_url" not in s or (agent.image_gen_available and "image_url" not in s)]
+        if missing:
+            # Don't keep a story with holes; the next run regenerates it
+            agent.story_cache.delete(key)
+            return key, monument_name, "failed", seconds, len(scenes), f"missing media in scenes {missing}"
+        return key, monument_name, "cached" if was_cached else "generated", seconds, len(scenes), None
+
+    print(f"Pre-warming {len(todo)} stories ({counts['skipped']} already done) "
+          f"with {args.stories} in parallel; limits gemini={args.gemini} imagen={args.imagen} elevenlabs={args.elevenlabs}")
+    wall_start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.stories) as executor:
+        futures = [executor.submit(warm, *entry) for entry in todo]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            key, monument_name, status, seconds, scenes, error = future.result()
+            counts[status] += 1
+            if status == "generated":
+                durations.append(seconds)
+            if status == "failed":
+                failures.append((monument_name, error))
+            record(key, monument_name, "failed" if status == "failed" else "ok", seconds, scenes, error)
+            print(f"[{done}/{len(todo)}] {status:9s} {monument_name} ({seconds:.1f}s){' - ' + error if error else ''}")
+
+    wall = time.perf_counter() - wall_start
+    processed = counts["generated"] + counts["cached"] + counts["failed"]
+    print("\n--- Pre-warm summary ---")
+    print(f"Generated: {counts['generated']}  Already cached: {counts['cached']}  "
+          f"Skipped (resumed): {counts['skipped']}  Failed: {counts['failed']}")
+    print(f"Wall time: {wall:.1f}s  Throughput: {processed / wall * 60 if wall else 0:.1f} stories/min")
+    if durations:
+        print(f"Per-story generation: avg {sum(durations) / len(durations):.1f}s  "
+              f"p50 {percentile(durations, 0.5):.1f}s  p95 {percentile(durations, 0.95):.1f}s")
+    print(f"Gemini limiter: {gemini_limiter.stats()}")
+    print(f"TTS: {agent.tts.stats()}")
+    if failures:
+        print("\nFailures (re-run to retry):")
+        for monument_name, error in failures:
+            print(f"  {monument_name}: {error}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from agents.city_walk_agent import CityWalkAgent
+from utils.session_store import SessionState
 
 # Mock classes to avoid importing from main.py
 class City:
@@ -28,6 +29,7 @@ class TestCityWalkAgent(unittest.TestCase):
     def setUp(self):
         load_dotenv()
         self.agent = CityWalkAgent()
+        self.session = SessionState("test")
         # Mock city data
         self.city_ny = City(latitude=40.7128, longitude=-74.0060, name="New York")
         self.metadata_ny = MetaData(city=self.city_ny, is_first_request=True)
@@ -42,7 +44,7 @@ class TestCityWalkAgent(unittest.TestCase):
     def test_basic_answer(self):
         print("\n--- Testing Basic Answer (New York) ---")
         query = "What are the top 3 places to visit?"
-        response = self.agent.answer(query, self.metadata_ny, first_request=True)
+        response = self.agent.answer(query, self.metadata_ny, first_request=True, session=self.session)
         
         print(f"Speech: {response.get('speech', '')[:100]}...")
         locations = response.get('locations', [])
@@ -55,11 +57,11 @@ class TestCityWalkAgent(unittest.TestCase):
     def test_preference_inference(self):
         print("\n--- Testing Preference Inference ---")
         # seed conversation
-        self.agent.conversation = [
+        conversation = [
              {"role": "user", "content": "I love art museums and quiet cafes."},
              {"role": "assistant", "content": "Noted!"}
         ]
-        prefs = self.agent.infer_user_preferences()
+        prefs = self.agent.infer_user_preferences(conversation)
         print(f"Inferred Prefs: {prefs}")
         
         has_museum = any("museum" in like.lower() for like in prefs.get('likes', []))
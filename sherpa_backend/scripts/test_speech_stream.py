@@ -0,0 +1,39 @@
+import json
+import os
+import sys
+import unittest
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.speech_stream import SpeechFieldExtractor, SentenceSplitter
+
+
+def extract(raw, chunk_size):
+    extractor = SpeechFieldExtractor()
+    return "".join(extractor.feed(raw[i:i + chunk_size]) for i in range(0, len(raw), chunk_size))
+
+
+class TestSpeechStream(unittest.TestCase):
+    def test_emoji_in_streamed_speech(self):
+        speech = "Welcome to the Colosseum 😀! Built in 80 AD 🏛️, it held 50,000 people. "
+        raw = json.dumps({"speech": speech, "action": "none"})  # ASCII-escaped surrogate pairs
+        self.assertIn("\\ud83d\\ude00", raw)
+
+        # Every chunk size splits the surrogate pair somewhere.
+        for chunk_size in range(1, 16):
+            text = extract(raw, chunk_size)
+            self.assertEqual(text, speech)
+
+            splitter = SentenceSplitter(min_chars=10)
+            sentences = splitter.feed(text) + splitter.flush()
+            for sentence in sentences:
+                sentence.encode("utf-8")  # TTS hashes the sentence bytes
+
+    def test_unpaired_and_invalid_escapes(self):
+        raw = '{"speech": "a\\ud83d b \\ude00 c \\uZZZZ d"}'
+        self.assertEqual(extract(raw, 3), "a� b � c � d")
+
+
+if __name__ == '__main__':
+    unittest.main()
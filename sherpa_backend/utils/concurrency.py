@@ -0,0 +1,98 @@
+import asyncio
+import concurrent.futures
+import functools
+import queue
+import threading
+
+
+class EndpointOverloaded(Exception):
+    """Raised when an endpoint pool has no free worker and its wait queue is full."""
+
+
+class EndpointPool:
+    """
+    Runs blocking endpoint work on a dedicated, explicitly sized thread pool so the
+    uvicorn event loop stays free. At most `max_concurrency` calls run at once,
+    up to `max_queue` more wait, and anything beyond that is rejected right away
+    (back-pressure) instead of piling up behind slow upstream calls.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix=f"{name}-endpoint"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"completed": 0, "failed": 0, "rejected": 0, "peak_in_flight": 0}
+
+    def _admit(self):
+        with self._lock:
+            if self._in_flight >= self.max_concurrency + self.max_queue:
+                self._stats["rejected"] += 1
+                raise EndpointOverloaded(f"{self.name} is at capacity ({self._in_flight} requests in flight)")
+            self._in_flight += 1
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._in_flight)
+
+    def _release(self, failed):
+        with self._lock:
+            self._in_flight -= 1
+            self._stats["failed" if failed else "completed"] += 1
+
+    async def run(self, fn, *args, **kwargs):
+        self._admit()
+        loop = asyncio.get_running_loop()
+        failed = True
+        try:
+            result = await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+            failed = False
+            return result
+        finally:
+            self._release(failed)
+
+    def stream(self, generator_fn, *args, **kwargs):
+        """
+        Runs a generator function on the pool and returns a blocking iterator over
+        its items (for StreamingResponse). The whole generator executes on one
+        pool thread, so it may hold locks across yields. An exception raised by the
+        generator is re-raised from the iterator.
+        """
+        self._admit()
+        items = queue.Queue()
+        done = object()
+
+        def produce():
+            failed = True
+            try:
+                for item in generator_fn(*args, **kwargs):
+                    items.put(item)
+                failed = False
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(done)
+                self._release(failed)
+
+        self.executor.submit(produce)
+
+        def consume():
+            while True:
+                item = items.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+        return consume()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = self._in_flight
+        stats["max_concurrency"] = self.max_concurrency
+        stats["max_queue"] = self.max_queue
+        return stats
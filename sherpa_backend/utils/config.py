@@ -23,3 +23,99 @@ class Config:
 
     # Google Cloud Project ID
     GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID", "project-34320a6d-6ed6-4151-8c6")
+
+    # Gemini rate limiting (per model, shared across the process)
+    GEMINI_QPM = int(os.getenv("GEMINI_QPM", "60"))  # Requests per minute budget
+    GEMINI_BURST = int(os.getenv("GEMINI_BURST", "10"))  # Calls allowed back-to-back before throttling
+    GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))  # Retries on 429 / ResourceExhausted
+    GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))  # Seconds, doubled per retry
+    GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30.0"))  # Upper bound for a single backoff
+
+    # Session state for /answer
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # "memory", "sqlite" or "file"
+    SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "session_cache/sessions.db")
+    SESSION_FILE_DIR = os.getenv("SESSION_FILE_DIR", "session_cache")
+    SESSION_MAX_IN_MEMORY = int(os.getenv("SESSION_MAX_IN_MEMORY", "1000"))  # LRU capacity per worker
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))  # Idle sessions expire after this
+
+    # Thread pool size for the concurrent lookups inside one /answer turn (shared by all turns)
+    AGENT_TURN_WORKERS = int(os.getenv("AGENT_TURN_WORKERS", "16"))
+
+    # Turn routing: one structured Gemini call instead of separate language/translation,
+    # target-city and information-seeking classifiers (per-function path is the fallback)
+    TURN_ROUTER_MODE = os.getenv("TURN_ROUTER_MODE", "false").lower() in ("1", "true", "yes")
+
+    # Background preference inference (runs after /answer responds)
+    PREFERENCE_WORKERS = int(os.getenv("PREFERENCE_WORKERS", "2"))
+
+    # Endpoint thread pools: concurrent requests per endpoint, plus how many may wait
+    # before new ones are rejected with 503
+    ANSWER_MAX_CONCURRENCY = int(os.getenv("ANSWER_MAX_CONCURRENCY", "8"))
+    ANSWER_MAX_QUEUE = int(os.getenv("ANSWER_MAX_QUEUE", "16"))
+    STORY_MAX_CONCURRENCY = int(os.getenv("STORY_MAX_CONCURRENCY", "4"))
+    STORY_MAX_QUEUE = int(os.getenv("STORY_MAX_QUEUE", "8"))
+
+    # Shared HTTP client (Places, Geocoding, Wikipedia): keep-alive connections kept per host
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+
+    # Nearby landmark search and its geohash tile cache
+    LANDMARK_SEARCH_RADIUS_M = float(os.getenv("LANDMARK_SEARCH_RADIUS_M", "5000"))
+    LANDMARK_CACHE_ENABLED = os.getenv("LANDMARK_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    LANDMARK_TILE_PRECISION = int(os.getenv("LANDMARK_TILE_PRECISION", "6"))  # ~1.2 x 0.6 km cells; queries in one cell share a result
+    LANDMARK_CACHE_TTL_SECONDS = int(os.getenv("LANDMARK_CACHE_TTL_SECONDS", str(7 * 86400)))
+    LANDMARK_CACHE_MAX_TILES = int(os.getenv("LANDMARK_CACHE_MAX_TILES", "5000"))
+
+    # Persistent geocode cache for get_city_coordinates
+    GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache/geocodes.db")
+    GEOCODE_SEED_PATH = os.getenv("GEOCODE_SEED_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "geocode_seed.json"))
+    GEOCODE_NEGATIVE_TTL_SECONDS = int(os.getenv("GEOCODE_NEGATIVE_TTL_SECONDS", "86400"))  # How long "not found" is remembered
+
+    # Wikipedia search/extract cache and landmark prefetching
+    WIKIPEDIA_CACHE_PATH = os.getenv("WIKIPEDIA_CACHE_PATH", "wikipedia_cache/wikipedia.db")
+    WIKIPEDIA_CACHE_TTL_SECONDS = int(os.getenv("WIKIPEDIA_CACHE_TTL_SECONDS", str(7 * 86400)))
+    WIKIPEDIA_CACHE_MAX_ENTRIES = int(os.getenv("WIKIPEDIA_CACHE_MAX_ENTRIES", "2000"))  # In-memory LRU size per level
+    WIKIPEDIA_PREFETCH_LIMIT = int(os.getenv("WIKIPEDIA_PREFETCH_LIMIT", "5"))  # Landmarks warmed per turn
+
+    # Return a streaming audio URL from /answer instead of waiting for full TTS synthesis
+    TTS_STREAMING_MODE = os.getenv("TTS_STREAMING_MODE", "false").lower() in ("1", "true", "yes")
+    TTS_STREAM_STORE_PATH = os.getenv("TTS_STREAM_STORE_PATH", "tts_cache/streams.db")  # Registered streams, shared by workers
+
+    # Persistent story cache (entries are also invalidated when the prompt/model config changes)
+    STORY_CACHE_PATH = os.getenv("STORY_CACHE_PATH", "story_cache/stories.db")
+    STORY_CACHE_TTL_SECONDS = int(os.getenv("STORY_CACHE_TTL_SECONDS", str(30 * 86400)))
+    STORY_CACHE_MAX_ENTRIES = int(os.getenv("STORY_CACHE_MAX_ENTRIES", "500"))  # In-memory LRU size
+
+    # Generated media (TTS audio, story images): sharded store with a byte budget
+    MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "audio_cache")
+    MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+    MEDIA_CACHE_POLICY = os.getenv("MEDIA_CACHE_POLICY", "lru").lower()  # "lru" or "lfu"
+
+    # Story images as background jobs (/api/generate_story returns image job ids, /api/jobs/{id} reports them)
+    STORY_IMAGE_JOBS = os.getenv("STORY_IMAGE_JOBS", "true").lower() in ("1", "true", "yes")
+    IMAGE_JOB_STORE_PATH = os.getenv("IMAGE_JOB_STORE_PATH", "job_cache/jobs.db")
+    IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "2"))
+    IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv("IMAGE_JOB_MAX_ATTEMPTS", "3"))
+    IMAGE_JOB_STALE_SECONDS = int(os.getenv("IMAGE_JOB_STALE_SECONDS", "60"))  # Job lease; renewed by the worker running it
+    IMAGE_JOB_WAIT_SECONDS = int(os.getenv("IMAGE_JOB_WAIT_SECONDS", "120"))  # How long the story stream waits for images
+
+    # Responsive story image variants (WebP, plus AVIF when Pillow supports it), encoded in a process pool
+    IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "480,960,1600").split(",") if w.strip()]
+    IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+
+    # Conversation history: recent messages kept verbatim (older ones are folded into a
+    # rolling summary) and the estimated token budget of the main /answer prompt
+    HISTORY_KEEP_MESSAGES = int(os.getenv("HISTORY_KEEP_MESSAGES", "6"))
+    HISTORY_SUMMARY_MAX_WORDS = int(os.getenv("HISTORY_SUMMARY_MAX_WORDS", "150"))
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "16000"))
+
+    # Constrain the main /answer output to the CityWalkResponse schema (JSON mode)
+    MAIN_RESPONSE_SCHEMA = os.getenv("MAIN_RESPONSE_SCHEMA", "true").lower() in ("1", "true", "yes")
+
+    # On-box language identification of the first query; the Gemini call runs only below this confidence
+    LANGUAGE_PROFILES_PATH = os.getenv("LANGUAGE_PROFILES_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "language_profiles.json"))
+    LANGUAGE_ID_MIN_CONFIDENCE = float(os.getenv("LANGUAGE_ID_MIN_CONFIDENCE", "0.8"))
+
+    # Local city gazetteer (memory-mapped, built by scripts/build_gazetteer.py) answering clear
+    # city mentions before the target-city LLM classifier and the Geocoding API
+    CITY_GAZETTEER = os.getenv("CITY_GAZETTEER", "true").lower() in ("1", "true", "yes")
+    GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "gazetteer.bin"))
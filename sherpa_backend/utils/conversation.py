@@ -0,0 +1,104 @@
+import json
+import threading
+
+# Rough Gemini tokenization for budget checks (no tokenizer call on the request path)
+CHARS_PER_TOKEN = 4
+# Prompt sizes remembered per session for growth reporting
+SESSION_PROMPT_HISTORY = 20
+# The landmark list is never trimmed below this many entries
+MIN_LANDMARKS = 5
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def history_messages(session):
+    """Compact history for prompts: the rolling summary (if any) followed by the recent turns."""
+    messages = []
+    if session.summary:
+        messages.append({"role": "user", "content": f"(Summary of the earlier conversation: {session.summary})"})
+    messages.extend(session.conversation)
+    return messages
+
+
+def fit_to_budget(system_prompt, summary_messages, recent_messages, turn_context, budget):
+    """
+    Builds the messages of the main call within `budget` estimated tokens. The
+    oldest recent turns are dropped first, then the landmark list in
+    `turn_context` is shortened. Returns (messages, estimated_tokens, trimmed).
+    """
+    recent = list(recent_messages)
+    context = dict(turn_context)
+    landmarks = list(context.get("landmarks_for_tour_location") or [])
+    trimmed = False
+
+    def total():
+        history = summary_messages + recent
+        return (estimate_tokens(system_prompt)
+                + sum(estimate_tokens(m["content"]) for m in history)
+                + estimate_tokens(json.dumps(context)))
+
+    tokens = total()
+    while tokens > budget and recent:
+        recent = recent[2:]  # One user/assistant exchange at a time
+        trimmed = True
+        tokens = total()
+    while tokens > budget and len(landmarks) > MIN_LANDMARKS:
+        landmarks = landmarks[:max(MIN_LANDMARKS, len(landmarks) // 2)]
+        context["landmarks_for_tour_location"] = landmarks
+        trimmed = True
+        tokens = total()
+
+    new_message = {"role": "user", "content": json.dumps(context)}
+    return summary_messages + recent + [new_message], tokens, trimmed
+
+
+def fallback_summary(previous_summary, messages, max_chars=1200):
+    """Extractive summary used when the summarization call fails: the latest exchanges, truncated."""
+    lines = [previous_summary] if previous_summary else []
+    for message in messages:
+        speaker = "Visitor" if message["role"] == "user" else "Guide"
+        lines.append(f"{speaker}: {message['content'][:200]}")
+    return " ".join(lines)[-max_chars:]
+
+
+class PromptMetrics:
+    """Process-wide prompt size statistics for the main /answer call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"prompts": 0, "tokens_total": 0, "tokens_max": 0, "trimmed": 0}
+
+    def record(self, session, tokens, trimmed):
+        """Records a prompt size globally and on the session. Returns growth since the previous turn."""
+        previous = session.prompt_tokens[-1] if session.prompt_tokens else None
+        session.prompt_tokens = (session.prompt_tokens + [tokens])[-SESSION_PROMPT_HISTORY:]
+        with self._lock:
+            self._stats["prompts"] += 1
+            self._stats["tokens_total"] += tokens
+            self._stats["tokens_max"] = max(self._stats["tokens_max"], tokens)
+            self._stats["trimmed"] += int(trimmed)
+        return tokens - previous if previous is not None else 0
+
+    @staticmethod
+    def session_stats(session):
+        sizes = session.prompt_tokens
+        growth = (sizes[-1] - sizes[0]) / (len(sizes) - 1) if len(sizes) > 1 else 0.0
+        return {
+            "turns_recorded": len(sizes),
+            "prompt_tokens": sizes,
+            "avg_growth_per_turn": round(growth, 1),
+            "history_messages": len(session.conversation),
+            "summary_chars": len(session.summary),
+        }
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        prompts = stats["prompts"]
+        stats["tokens_avg"] = round(stats.pop("tokens_total") / prompts, 1) if prompts else 0.0
+        return stats
+
+
+prompt_metrics = PromptMetrics()
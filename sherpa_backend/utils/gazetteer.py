@@ -0,0 +1,297 @@
+import hashlib
+import mmap
+import re
+import struct
+import threading
+import unicodedata
+
+MAGIC = b"SGZ1"
+# magic, city count, table slots, longest alias in tokens, offsets of cities / table / names
+_HEADER = struct.Struct("<4sIII3Q")
+# latitude, longitude, population, name offset, name length
+_CITY = struct.Struct("<ddQII")
+# phrase hash, city index (-1 for pure prefixes), flags
+_SLOT = struct.Struct("<QiI")
+
+TERMINAL = 1  # the phrase is a city name or alias
+PREFIX = 2  # the phrase starts a longer alias
+AMBIGUOUS = 4  # several cities share the alias and none clearly dominates
+COMMON_WORD = 8  # the alias is also an ordinary word or first name
+
+# A city owns a shared alias only if it is this many times more populous than the runner-up
+AMBIGUITY_RATIO = 10
+COMMON_WORDS = {
+    "nice", "split", "bath", "canton", "mecca", "rio", "sofia", "florence", "adelaide",
+    "austin", "savannah", "orlando", "salvador", "petra", "angkor", "washington", "york",
+}
+# Words that suggest a place is meant even though no known city name was found
+# ("the capital of Japan", "plan a tour there"); such queries still go to the LLM
+PLACE_CUES = {
+    "city", "town", "capital", "country", "visit", "trip", "travel", "tour", "go", "going", "there", "fly", "move",
+    "ciudad", "pueblo", "viaje", "visitar", "ir", "alli",
+    "ville", "capitale", "voyage", "visiter", "aller",
+    "stadt", "hauptstadt", "reise", "besuchen", "fahren", "dort", "dorthin",
+    "citta", "viaggio", "visitare", "andare",
+    "cidade", "viagem",
+}
+
+_WORD = re.compile(r"\w+")
+# Capitalized words that don't start a sentence ("What about Hampi?"): possibly a place
+# missing from the gazetteer, so the LLM decides. "I" and its contractions don't count.
+_CAPITALIZED = re.compile(r"(?<![\w'’])[A-ZÀ-ÞĀ-Ž][^\W\d_]+")
+_SENTENCE_START = re.compile(r"(?:^|[.!?¿¡:;\n])[\s\"'“‘(¿¡]*$")
+
+
+def _is_cjk(char):
+    code = ord(char)
+    return 0x3040 <= code <= 0x30FF or 0x3400 <= code <= 0x4DBF or 0x4E00 <= code <= 0x9FFF
+
+
+def tokenize(text):
+    """
+    Lowercase tokens with Latin diacritics removed. Han and Kana characters are
+    one token each, since Chinese and Japanese don't separate words with spaces.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not 0x0300 <= ord(c) <= 0x036F)
+    text = unicodedata.normalize("NFC", text)
+    tokens = []
+    for word in _WORD.findall(text):
+        if any(_is_cjk(c) for c in word):
+            run = ""
+            for c in word:
+                if _is_cjk(c):
+                    if run:
+                        tokens.append(run)
+                        run = ""
+                    tokens.append(c)
+                else:
+                    run += c
+            if run:
+                tokens.append(run)
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def _phrase_hash(tokens):
+    digest = hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1  # 0 marks an empty slot
+
+
+def display_name(name, country):
+    return name if not country or name == country else f"{name}, {country}"
+
+
+def build_gazetteer(cities, path):
+    """
+    Writes the memory-mappable gazetteer for `cities`, a list of dicts with name,
+    country, lat, lng, population and aliases. Returns (cities, aliases) written.
+
+    The alias trie is flattened into an open-addressing hash table keyed by the
+    token phrase: every alias is a TERMINAL entry and each of its leading token
+    sequences a PREFIX entry, so matching walks it like a word-level trie.
+    """
+    names = bytearray()
+    records = []
+    owners = {}  # phrase tuple -> [(population, city index)]
+    for index, city in enumerate(cities):
+        full_name = display_name(city["name"], city.get("country"))
+        encoded = full_name.encode("utf-8")
+        records.append(_CITY.pack(city["lat"], city["lng"], int(city.get("population") or 0), len(names), len(encoded)))
+        names += encoded
+        for alias in [city["name"], full_name] + list(city.get("aliases") or []):
+            phrase = tuple(tokenize(alias))
+            if phrase:
+                entries = owners.setdefault(phrase, [])
+                if index not in [i for _, i in entries]:
+                    entries.append((int(city.get("population") or 0), index))
+
+    slots = {}  # phrase tuple -> (city index, flags)
+    for phrase, entries in owners.items():
+        entries.sort(reverse=True)
+        flags = TERMINAL
+        if len(entries) > 1 and entries[0][0] < AMBIGUITY_RATIO * entries[1][0]:
+            flags |= AMBIGUOUS
+        if len(phrase) == 1 and phrase[0] in COMMON_WORDS:
+            flags |= COMMON_WORD
+        slots[phrase] = (entries[0][1], flags)
+    for phrase in list(owners):
+        for length in range(1, len(phrase)):
+            prefix = phrase[:length]
+            city_index, flags = slots.get(prefix, (-1, 0))
+            slots[prefix] = (city_index, flags | PREFIX)
+
+    size = 1
+    while size < 2 * len(slots):
+        size *= 2
+    table = [None] * size
+    for phrase, (city_index, flags) in slots.items():
+        h = _phrase_hash(phrase)
+        i = h & (size - 1)
+        while table[i] is not None:
+            i = (i + 1) & (size - 1)
+        table[i] = (h, city_index, flags)
+
+    max_tokens = max((len(phrase) for phrase in owners), default=1)
+    cities_offset = _HEADER.size
+    table_offset = cities_offset + _CITY.size * len(records)
+    names_offset = table_offset + _SLOT.size * size
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(records), size, max_tokens, cities_offset, table_offset, names_offset))
+        f.writelines(records)
+        for slot in table:
+            f.write(_SLOT.pack(*slot) if slot else _SLOT.pack(0, -1, 0))
+        f.write(bytes(names))
+    return len(records), len(owners)
+
+
+class Gazetteer:
+    """
+    Local world-city gazetteer for spotting city names in queries.
+
+    The data file (built by scripts/build_gazetteer.py) is memory-mapped, so
+    startup is instant, the OS shares the pages between worker processes and the
+    dataset can grow to every populated place in GeoNames without loading it into
+    Python objects. Matching walks the query's tokens through the flattened alias
+    trie, leftmost-longest like Aho-Corasick: a few hash probes per token.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.city_count, self._size, self.max_tokens, self._cities, self._table, self._names = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer file")
+        self._lock = threading.Lock()
+        self._stats = {"matched": 0, "no_city": 0, "deferred": 0, "lookups": 0, "lookup_hits": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _probe(self, tokens):
+        """(city index, flags) for a token phrase, or None."""
+        h = _phrase_hash(tokens)
+        mask = self._size - 1
+        i = h & mask
+        while True:
+            slot_hash, city_index, flags = _SLOT.unpack_from(self._mm, self._table + i * _SLOT.size)
+            if slot_hash == h:
+                return city_index, flags
+            if slot_hash == 0:
+                return None
+            i = (i + 1) & mask
+
+    def city(self, index):
+        lat, lng, population, name_offset, name_length = _CITY.unpack_from(self._mm, self._cities + index * _CITY.size)
+        start = self._names + name_offset
+        name = self._mm[start:start + name_length].decode("utf-8")
+        return {"name": name, "lat": lat, "lng": lng, "population": population}
+
+    def find_cities(self, text):
+        """
+        City mentions in `text`, leftmost-longest: a list of dicts with the city,
+        the matched `alias` and whether it is `ambiguous` or a `common_word`.
+        """
+        tokens = tokenize(text)
+        matches = []
+        i = 0
+        while i < len(tokens):
+            best = None
+            for j in range(i + 1, min(len(tokens), i + self.max_tokens) + 1):
+                entry = self._probe(tokens[i:j])
+                if entry is None:
+                    break
+                city_index, flags = entry
+                if flags & TERMINAL:
+                    best = (j, city_index, flags)
+                if not flags & PREFIX:
+                    break
+            if best is None:
+                i += 1
+                continue
+            j, city_index, flags = best
+            matches.append({
+                **self.city(city_index),
+                "alias": " ".join(tokens[i:j]),
+                "ambiguous": bool(flags & AMBIGUOUS),
+                "common_word": bool(flags & COMMON_WORD),
+            })
+            i = j
+        return matches
+
+    def lookup(self, name):
+        """Coordinates ({"lat", "lng"}) for an exact, unambiguous city name or alias, else None."""
+        self._count("lookups")
+        for candidate in (name, name.split(",")[0]):
+            tokens = tokenize(candidate)
+            entry = self._probe(tokens) if tokens else None
+            if entry and entry[1] & TERMINAL and not entry[1] & AMBIGUOUS:
+                city = self.city(entry[0])
+                self._count("lookup_hits")
+                return {"lat": city["lat"], "lng": city["lng"]}
+        return None
+
+    def detect_city(self, query, conversation=None):
+        """
+        Local replacement for the target-city classifier. Returns
+        {"is_different_city", "target_city", "coordinates"} when the answer is
+        clear from the query, or None when the LLM should decide: several or
+        ambiguous cities, a capitalized name the gazetteer doesn't know, or an
+        indirect reference ("the capital of Japan", "let's go there"). Aliases
+        that are also common words ("nice") are ignored next to another city,
+        and sent to the LLM when capitalized on their own.
+        """
+        found = self.find_cities(query)
+        matches = [m for m in found if not m["common_word"]]
+        names = {m["name"] for m in matches}
+        if len(names) == 1 and not any(m["ambiguous"] for m in matches):
+            city = matches[0]
+            self._count("matched")
+            return {
+                "is_different_city": True,
+                "target_city": city["name"],
+                "coordinates": {"lat": city["lat"], "lng": city["lng"]},
+            }
+        capitalized_common_word = any(
+            m["common_word"] and re.search(r"\b" + m["alias"].capitalize() + r"\b", query) for m in found
+        )
+        if not matches and not capitalized_common_word and not self._needs_context(query, conversation):
+            self._count("no_city")
+            return {"is_different_city": False, "target_city": None}
+        self._count("deferred")
+        return None
+
+    def _needs_context(self, query, conversation):
+        tokens = tokenize(query)
+        if any(c > "\u024f" for token in tokens for c in token):
+            return True  # No cue words for non-Latin scripts; let the LLM judge
+        if PLACE_CUES.intersection(tokens) or self._has_proper_noun(query):
+            return True
+        # A short answer to the guide's question about a city ("yes, let's do it")
+        last_reply = next((m["content"] for m in reversed(conversation or []) if m.get("role") == "assistant"), "")
+        return bool(last_reply and self.find_cities(last_reply))
+
+    @staticmethod
+    def _has_proper_noun(query):
+        for match in _CAPITALIZED.finditer(query):
+            if not _SENTENCE_START.search(query[:match.start()]):
+                return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["cities"] = self.city_count
+        return stats
+
+
+def load_gazetteer(path):
+    """The gazetteer at `path`, or None (with a warning) if it can't be opened."""
+    try:
+        return Gazetteer(path)
+    except (OSError, ValueError) as e:
+        print(f"Warning: city gazetteer not loaded from {path}: {e}")
+        return None
@@ -0,0 +1,57 @@
+import math
+
+EARTH_RADIUS_M = 6371000.0
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def geohash_encode(lat, lng, precision):
+    """Standard base32 geohash of a point."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[ch])
+            bit = 0
+            ch = 0
+    return "".join(chars)
+
+
+def geohash_bbox(geohash):
+    """(min_lat, min_lng, max_lat, max_lng) of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
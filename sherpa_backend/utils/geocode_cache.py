@@ -0,0 +1,134 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+
+def normalize_place_name(name):
+    """
+    Canonical cache key for a place name: case, accents, punctuation and
+    whitespace differences ("  São Paulo,Brazil " / "sao paulo, brazil") collapse.
+    """
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    parts = [re.sub(r"[^\w\s]", " ", part) for part in text.split(",")]
+    parts = [" ".join(part.split()) for part in parts]
+    return ", ".join(part for part in parts if part)
+
+
+class GeocodeCache:
+    """
+    Persistent geocode cache in SQLite with an in-memory dict in front.
+
+    All rows are loaded at startup so lookups are a dict access. Successful
+    results never expire; "not found" results are cached for `negative_ttl_seconds`
+    so misspelt or fictional names don't hit the API on every turn.
+    """
+
+    # Returned by get() when there is no usable entry
+    MISS = object()
+
+    def __init__(self, db_path, negative_ttl_seconds=86400):
+        self.db_path = str(db_path)
+        self.negative_ttl_seconds = negative_ttl_seconds
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocodes ("
+            "name TEXT PRIMARY KEY, lat REAL, lng REAL, found INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._entries = {}  # normalized name -> ({'lat','lng'} or None, updated_at)
+        for name, lat, lng, found, updated_at in self._conn.execute("SELECT name, lat, lng, found, updated_at FROM geocodes"):
+            self._entries[name] = ({'lat': lat, 'lng': lng} if found else None, updated_at)
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+
+    def get(self, name):
+        """Cached coordinates, None for a cached "not found", or GeocodeCache.MISS."""
+        key = normalize_place_name(name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Another worker may have geocoded it since startup
+                row = self._conn.execute(
+                    "SELECT lat, lng, found, updated_at FROM geocodes WHERE name = ?", (key,)
+                ).fetchone()
+                if row:
+                    entry = ({'lat': row[0], 'lng': row[1]} if row[2] else None, row[3])
+                    self._entries[key] = entry
+            if entry is None:
+                self._stats["misses"] += 1
+                return self.MISS
+            coords, updated_at = entry
+            if coords is None:
+                if time.time() - updated_at > self.negative_ttl_seconds:
+                    self._stats["misses"] += 1
+                    return self.MISS
+                self._stats["negative_hits"] += 1
+                return None
+            self._stats["hits"] += 1
+            return dict(coords)
+
+    def put(self, name, coords):
+        """Store coordinates ({'lat','lng'}) or None for a definitive "not found"."""
+        self.put_many([(name, coords)])
+
+    def put_many(self, items):
+        now = time.time()
+        rows = []
+        with self._lock:
+            for name, coords in items:
+                key = normalize_place_name(name)
+                if not key:
+                    continue
+                self._entries[key] = (dict(coords) if coords else None, now)
+                rows.append((
+                    key,
+                    coords['lat'] if coords else None,
+                    coords['lng'] if coords else None,
+                    1 if coords else 0,
+                    now,
+                ))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO geocodes (name, lat, lng, found, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def preload(self, seed_path):
+        """
+        Bulk-load a JSON seed file: [{"name": ..., "lat": ..., "lng": ..., "aliases": [...]}].
+        Existing entries are kept, so seeding on every startup is cheap.
+        """
+        try:
+            with open(seed_path) as f:
+                seed = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Geocode seed not loaded from {seed_path}: {e}")
+            return 0
+        items = {}
+        with self._lock:
+            for city in seed:
+                coords = {'lat': city['lat'], 'lng': city['lng']}
+                for name in [city['name']] + city.get('aliases', []):
+                    key = normalize_place_name(name)
+                    if key not in self._entries and key not in items:
+                        items[key] = (name, coords)
+        items = list(items.values())
+        if items:
+            self.put_many(items)
+        print(f"Geocode cache: {len(items)} seed entries added, {len(self._entries)} total")
+        return len(items)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["negative_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,111 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.config import Config
+
+
+# Per-host connection policy: (connect, read) timeouts in seconds and retry budget.
+# Places/Geocoding POST queries are read-only, so retrying them is safe.
+HOST_POLICIES = {
+    "places.googleapis.com": {"timeout": (3.05, 10.0), "retries": 2},
+    "maps.googleapis.com": {"timeout": (3.05, 5.0), "retries": 2},
+    "en.wikipedia.org": {"timeout": (2.0, 2.0), "retries": 1},
+}
+DEFAULT_POLICY = {"timeout": (3.05, 10.0), "retries": 1}
+
+
+class HttpClient:
+    """
+    Shared keep-alive HTTP client for the Google Maps and Wikipedia APIs.
+    Connections are pooled per host and reused across requests, so a turn no
+    longer pays a TCP+TLS handshake per call. Every request gets a timeout and
+    a retry policy from HOST_POLICIES, and latency is recorded per endpoint.
+    (requests/urllib3 speak HTTP/1.1 only; keep-alive is where the savings are.)
+    """
+
+    def __init__(self, pool_maxsize=None, headers=None):
+        self.pool_maxsize = pool_maxsize or Config.HTTP_POOL_MAXSIZE
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        for host, policy in HOST_POLICIES.items():
+            self.session.mount(f"https://{host}", self._adapter(policy["retries"]))
+        self.session.mount("https://", self._adapter(DEFAULT_POLICY["retries"]))
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _adapter(self, retries):
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        return HTTPAdapter(
+            pool_connections=len(HOST_POLICIES) + 1,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+
+    @staticmethod
+    def _policy(url):
+        return HOST_POLICIES.get(urlparse(url).hostname, DEFAULT_POLICY)
+
+    def _record(self, endpoint, elapsed, failed):
+        with self._lock:
+            metric = self._metrics.setdefault(
+                endpoint, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            metric["count"] += 1
+            metric["total_ms"] += elapsed * 1000
+            metric["max_ms"] = max(metric["max_ms"], elapsed * 1000)
+            if failed:
+                metric["errors"] += 1
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        """
+        Sends a request through the pooled session. `endpoint` names the metric
+        bucket (defaults to the host); `timeout` defaults to the host policy.
+        """
+        kwargs.setdefault("timeout", self._policy(url)["timeout"])
+        endpoint = endpoint or urlparse(url).hostname
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self._record(endpoint, time.perf_counter() - start, failed)
+
+    def get(self, url, endpoint=None, **kwargs):
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint=None, **kwargs):
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    "count": m["count"],
+                    "errors": m["errors"],
+                    "avg_ms": round(m["total_ms"] / m["count"], 1) if m["count"] else 0.0,
+                    "max_ms": round(m["max_ms"], 1),
+                }
+                for endpoint, m in self._metrics.items()
+            }
+
+
+# Shared client used by all agents in this process
+http_client = HttpClient()
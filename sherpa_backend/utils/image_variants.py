@@ -0,0 +1,161 @@
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageFilter, features
+    PIL_AVAILABLE = True
+    AVIF_AVAILABLE = features.check("avif")
+except ImportError:
+    PIL_AVAILABLE = False
+    AVIF_AVAILABLE = False
+
+PLACEHOLDER_WIDTH = 32
+# Encoder settings per format (quality is on each encoder's own scale)
+FORMAT_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "avif": {"format": "AVIF", "quality": 60},
+}
+MIME_TYPES = {"webp": "image/webp", "avif": "image/avif", "png": "image/png"}
+
+
+def variant_name(original_name, width, fmt):
+    """"story_x_0.png" -> "story_x_0.w480.webp"."""
+    return f"{original_name.split('.', 1)[0]}.w{width}.{fmt}"
+
+
+def placeholder_name(original_name):
+    return f"{original_name.split('.', 1)[0]}.placeholder.webp"
+
+
+def encode_variants(original_path, widths, formats):
+    """
+    Runs in a worker process: writes resized variants of `original_path` next to
+    it, plus a tiny blurred placeholder. Returns the names of the files written.
+    """
+    original_path = Path(original_path)
+    written = []
+    with Image.open(original_path) as image:
+        image = image.convert("RGB")
+        for width in widths:
+            if width > image.width:
+                continue  # Never upscale; larger requests get the widest variant
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                name = variant_name(original_path.name, width, fmt)
+                _save_atomic(resized, original_path.with_name(name), FORMAT_OPTIONS[fmt])
+                written.append(name)
+
+        height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+        placeholder = image.resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(2))
+        name = placeholder_name(original_path.name)
+        _save_atomic(placeholder, original_path.with_name(name), {"format": "WEBP", "quality": 30})
+        written.append(name)
+    return written
+
+
+def _save_atomic(image, path, options):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        image.save(tmp_path, **options)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+
+
+class ImageVariantProcessor:
+    """
+    Produces responsive variants (WebP, plus AVIF when Pillow supports it) of
+    generated images at several widths, and picks the best one for a request.
+
+    Encoding is CPU-bound, so it runs in a process pool (spawned lazily on first
+    use) instead of holding the GIL in request worker threads. Variants are
+    registered in the media cache next to their original.
+    """
+
+    def __init__(self, media_cache, widths, max_workers=2):
+        self.media_cache = media_cache
+        self.widths = sorted(widths)
+        self.formats = (["avif"] if AVIF_AVAILABLE else []) + ["webp"]
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "variants_written": 0}
+        if not PIL_AVAILABLE:
+            print("Warning: Pillow not installed; story images are served without responsive variants.")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def submit(self, image_filename):
+        """Encodes variants of a cached image in the background. Returns the future or None."""
+        if not PIL_AVAILABLE:
+            return None
+        self._count("submitted")
+        future = self._executor().submit(
+            encode_variants, str(self.media_cache.path_for(image_filename)), self.widths, self.formats
+        )
+        future.add_done_callback(lambda f: self._register(image_filename, f))
+        return future
+
+    def _register(self, image_filename, future):
+        try:
+            names = future.result()
+        except Exception as e:
+            print(f"Image variant encoding failed for {image_filename}: {e}")
+            self._count("failed")
+            if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+                with self._lock:
+                    self._pool = None  # A worker died; start a fresh pool on the next submit
+            return
+        for name in names:
+            self.media_cache.add(name, "image_variant")
+        self._count("completed")
+        self._count("variants_written", len(names))
+
+    def select(self, image_filename, accept="", width=None):
+        """
+        Path and media type of the best cached file for a request: the smallest
+        variant at least `width` wide (the widest one if none is) in the best
+        format the `Accept` header allows, else the original. A `width` of at most
+        PLACEHOLDER_WIDTH selects the blurred placeholder. None if nothing is cached.
+        Probing doesn't record cache accesses; serving the file does.
+        """
+        accept = (accept or "").lower()
+        if width and width <= PLACEHOLDER_WIDTH:
+            name = placeholder_name(image_filename)
+            if self.media_cache.contains(name):
+                return self.media_cache.path_for(name), MIME_TYPES["webp"]
+        for fmt in self.formats:
+            if MIME_TYPES[fmt] not in accept:
+                continue
+            # Smallest width that covers the request, then falling back from the widest
+            order = [w for w in self.widths if width and w >= width] + self.widths[::-1]
+            for w in dict.fromkeys(order):
+                name = variant_name(image_filename, w, fmt)
+                if self.media_cache.contains(name):
+                    return self.media_cache.path_for(name), MIME_TYPES[fmt]
+        if not self.media_cache.contains(image_filename):
+            return None
+        return self.media_cache.path_for(image_filename), MIME_TYPES.get(image_filename.rsplit(".", 1)[-1], "application/octet-stream")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["formats"] = self.formats
+        stats["widths"] = self.widths
+        return stats
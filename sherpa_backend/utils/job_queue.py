@@ -0,0 +1,200 @@
+import concurrent.futures
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ABANDONED = "abandoned by its worker"
+
+
+class JobQueue:
+    """
+    Background jobs run on a local worker pool, with their status kept in SQLite
+    so any worker process can answer `/api/jobs/{id}`.
+
+    Job ids are derived from a caller-supplied key, so submitting the same work
+    while it is queued or running returns the existing job instead of running it
+    again. A failing handler
+    is retried with jittered backoff up to `max_attempts`. A job that still fails
+    can be resubmitted from its stored payload.
+
+    The process running a job renews its `updated_at` every third of
+    `stale_seconds`; a queued or running job whose lease lapsed belongs to a
+    process that went away, so it reads as failed and a new submit reruns it.
+    """
+
+    def __init__(self, db_path, name="jobs", max_workers=2, max_attempts=3, retry_base_seconds=2.0, stale_seconds=60):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.stale_seconds = stale_seconds
+        self._handlers = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"{name}-job"
+        )
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._local = set()  # Job ids queued or running in this process
+        self._stats = {"submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "retries": 0, "resubmitted": 0, "reclaimed": 0}
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL, "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        threading.Thread(target=self._renew_leases, name=f"{name}-lease", daemon=True).start()
+
+    def register(self, kind, handler):
+        """`handler(payload)` returns a JSON-serializable result or raises to signal failure."""
+        self._handlers[kind] = handler
+
+    @staticmethod
+    def job_id(kind, key):
+        return f"{kind}-{hashlib.md5(key.encode()).hexdigest()[:16]}"
+
+    # --- store ----------------------------------------------------------------
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id):
+        """Job status dict (without the payload), or None for unknown ids."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("id", "kind", "status", "result", "error", "attempts", "created_at", "updated_at"), row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        if job["status"] in (QUEUED, RUNNING) and self._is_stale(job):
+            job["status"] = FAILED
+            job["error"] = ABANDONED
+        return job
+
+    def _is_stale(self, job):
+        with self._lock:
+            local = job["id"] in self._local
+        return not local and time.time() - job["updated_at"] > self.stale_seconds
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.stale_seconds / 3)
+            with self._lock:
+                if not self._local:
+                    continue
+                job_ids = list(self._local)
+                self._conn.execute(
+                    f"UPDATE jobs SET updated_at = ? WHERE id IN ({', '.join('?' * len(job_ids))}) AND status IN (?, ?)",
+                    (time.time(), *job_ids, QUEUED, RUNNING)
+                )
+                self._conn.commit()
+
+    # --- submission --------------------------------------------------------
+
+    def submit(self, kind, key, payload):
+        """
+        Queues a job for `key` unless one is already queued or running under a live
+        lease; returns the job id. Finished and abandoned jobs are rerun, since
+        callers only resubmit when the result they produced (e.g. a cached file) is gone.
+        """
+        job_id = self.job_id(kind, key)
+        job = self.get(job_id)
+        if job and job["status"] in (QUEUED, RUNNING):
+            with self._lock:
+                self._stats["deduplicated"] += 1
+            return job_id
+        if job and job["error"] == ABANDONED:
+            with self._lock:
+                self._stats["reclaimed"] += 1
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, status, payload, result, error, attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, NULL, NULL, 0, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(payload), now, now)
+            )
+            self._conn.commit()
+            self._stats["submitted"] += 1
+        self._enqueue(job_id, kind, payload)
+        return job_id
+
+    def retry(self, job_id):
+        """Resubmits a failed (or abandoned) job from its stored payload. Returns its status."""
+        job = self.get(job_id)
+        if job is None or job["status"] != FAILED:
+            return job
+        with self._lock:
+            kind, payload = self._conn.execute("SELECT kind, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self._stats["resubmitted"] += 1
+        self._update(job_id, status=QUEUED, error=None, attempts=0)
+        self._enqueue(job_id, kind, json.loads(payload))
+        return self.get(job_id)
+
+    def _enqueue(self, job_id, kind, payload):
+        with self._lock:
+            if job_id in self._local:
+                return
+            self._local.add(job_id)
+        self._executor.submit(self._run, job_id, kind, payload)
+
+    def _run(self, job_id, kind, payload):
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                self._update(job_id, status=RUNNING, attempts=attempt)
+                try:
+                    result = self._handlers[kind](payload)
+                except Exception as e:
+                    print(f"Job {job_id} attempt {attempt}/{self.max_attempts} failed: {e}")
+                    if attempt < self.max_attempts:
+                        with self._lock:
+                            self._stats["retries"] += 1
+                        time.sleep(random.uniform(0, self.retry_base_seconds * 2 ** (attempt - 1)))
+                        continue
+                    self._update(job_id, status=FAILED, error=str(e))
+                    with self._lock:
+                        self._stats["failed"] += 1
+                    return
+                self._update(job_id, status=SUCCEEDED, result=json.dumps(result), error=None)
+                with self._lock:
+                    self._stats["succeeded"] += 1
+                return
+        finally:
+            with self._lock:
+                self._local.discard(job_id)
+                self._finished.notify_all()
+
+    def wait(self, job_id, timeout=None):
+        """Blocks until a job queued in this process finishes (or `timeout`); returns its status."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while job_id in self._local:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._finished.wait(remaining)
+        return self.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._local)
+        return stats
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+from utils.geo import geohash_bbox, geohash_encode
+from utils.single_flight import single_flight
+
+
+class LandmarkCache:
+    """
+    Tile cache for Places `searchNearby` results.
+
+    A query is snapped to the geohash cell containing its center and answered
+    with one `searchNearby` call around the cell's center, so every query whose
+    center falls in the same cell (about 1.2 x 0.6 km at precision 6) shares one
+    result. A cold query costs the same single call as the uncached path, the
+    API's popularity order is kept as is, and concurrent misses for a cell
+    share one call. Cells are evicted by TTL and LRU.
+    """
+
+    def __init__(self, fetch_tile, precision=6, ttl_seconds=7 * 86400, max_tiles=5000):
+        # fetch_tile(lat, lng, radius_m) -> list of places shaped like get_nearby_landmarks output
+        self.fetch_tile = fetch_tile
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()  # (geohash, radius_m) -> (places, fetched_at)
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "tile_hits": 0, "tile_misses": 0, "api_calls": 0, "api_errors": 0}
+
+    def _get_tile(self, key, now):
+        entry = self._tiles.get(key)
+        if entry is None:
+            return None
+        if now - entry[1] > self.ttl_seconds:
+            del self._tiles[key]
+            return None
+        self._tiles.move_to_end(key)
+        return entry[0]
+
+    def _put_tile(self, key, places, now):
+        self._tiles[key] = (places, now)
+        self._tiles.move_to_end(key)
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+
+    def _cached_tile(self, key):
+        with self._lock:
+            return self._get_tile(key, time.time())
+
+    def _load_tile(self, key):
+        """Fetch one cell: the places within the radius of its center, in the API's order."""
+        geohash, radius_m = key
+        min_lat, min_lng, max_lat, max_lng = geohash_bbox(geohash)
+        with self._lock:
+            self._stats["api_calls"] += 1
+        places = self.fetch_tile((min_lat + max_lat) / 2, (min_lng + max_lng) / 2, radius_m)
+        with self._lock:
+            self._put_tile(key, places, time.time())
+        return places
+
+    def nearby(self, lat, lng, radius_m, max_results=20):
+        """Landmarks within about `radius_m` of (lat, lng), most relevant first."""
+        key = (geohash_encode(lat, lng, self.precision), float(radius_m))
+        places = self._cached_tile(key)
+        hit = places is not None
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["tile_hits" if hit else "tile_misses"] += 1
+        if not hit:
+            try:
+                # Users starting in the same new area share one searchNearby call
+                places = single_flight.do(
+                    "landmark_tile", key, lambda: self._load_tile(key), lookup=lambda: self._cached_tile(key)
+                )
+            except Exception as e:
+                with self._lock:
+                    self._stats["api_errors"] += 1
+                print(f"[Landmark Cache] Failed to fetch tile {key[0]}: {e}")
+                return []
+        print(f"[Landmark Cache] Tile {key[0]} {'hit' if hit else 'miss'}, {len(places)} landmarks")
+        # Copies so callers can't mutate cached entries
+        return [{**place, 'location': dict(place['location'])} for place in places[:max_results]]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_tiles"] = len(self._tiles)
+        lookups = stats["tile_hits"] + stats["tile_misses"]
+        stats["tile_hit_rate"] = round(stats["tile_hits"] / lookups, 3) if lookups else 0.0
+        stats["precision"] = self.precision
+        # Relative to the uncached path, which made one searchNearby call per query
+        stats["api_calls_saved"] = stats["queries"] - stats["api_calls"]
+        return stats
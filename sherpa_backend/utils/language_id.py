@@ -0,0 +1,179 @@
+import json
+import math
+import re
+import threading
+import unicodedata
+
+from utils.config import Config
+
+# Scripts used by a single supported language: (first, last code point, language, confidence).
+# Confidence stays below 1 where other languages share the script.
+_SCRIPT_RANGES = [
+    (0x3040, 0x30FF, "Japanese", 1.0),   # Hiragana, Katakana
+    (0x31F0, 0x31FF, "Japanese", 1.0),   # Katakana extensions
+    (0x1100, 0x11FF, "Korean", 1.0),     # Hangul Jamo
+    (0x3130, 0x318F, "Korean", 1.0),     # Hangul compatibility Jamo
+    (0xAC00, 0xD7AF, "Korean", 1.0),     # Hangul syllables
+    (0x4E00, 0x9FFF, "Chinese", 0.9),    # CJK ideographs (kanji-only Japanese is possible)
+    (0x3400, 0x4DBF, "Chinese", 0.9),
+    (0x0600, 0x06FF, "Arabic", 0.9),     # Persian and Urdu use it too
+    (0x0750, 0x077F, "Arabic", 0.9),
+    (0x0400, 0x04FF, "Russian", 0.9),    # Ukrainian, Bulgarian, Serbian...
+    (0x0900, 0x097F, "Hindi", 0.9),      # Marathi and Nepali use it too
+]
+# Letters that point to another language of the same script
+_FOREIGN_LETTERS = {
+    "Russian": set("іїєґўјљњћџ"),
+    "Arabic": set("پچژگکی"),
+}
+_NON_LETTERS = re.compile(r"[^\w]+|[\d_]+")
+
+NGRAM_ORDERS = (1, 2, 3)
+# Below this many letters the n-gram confidence is scaled down proportionally
+MIN_LETTERS = 12
+# Sharpness of the softmax over per-n-gram average log-likelihoods
+SHARPNESS = 12.0
+# Average n-gram log-likelihood of the best profile: text in a supported language scores
+# above FULL_FIT; text scoring lower (e.g. Dutch or romanized Hindi) loses confidence,
+# down to zero at MIN_FIT. Tuned with scripts/benchmark_language_id.py.
+FULL_FIT = -5.3
+MIN_FIT = -5.9
+
+
+def _script_language(char):
+    code = ord(char)
+    for first, last, language, confidence in _SCRIPT_RANGES:
+        if first <= code <= last:
+            return language, confidence
+    return None, 0.0
+
+
+def _ngrams(text):
+    """Character n-grams of the lowercase words in `text`, padded with spaces at word boundaries."""
+    for word in _NON_LETTERS.sub(" ", unicodedata.normalize("NFC", text.lower())).split():
+        padded = f" {word} "
+        for order in NGRAM_ORDERS:
+            for i in range(len(padded) - order + 1):
+                gram = padded[i:i + order]
+                if gram != " ":
+                    yield gram
+
+
+def build_profiles(samples, max_ngrams_per_order=300, alpha=0.5):
+    """
+    N-gram log-probability profiles from {language: [sentences]}: the most frequent
+    n-grams of each order with add-alpha smoothing, plus the log-probability
+    assigned to unseen n-grams of each order.
+    """
+    counts = {}
+    vocabulary = {order: set() for order in NGRAM_ORDERS}
+    for language, sentences in samples.items():
+        language_counts = counts[language] = {}
+        for sentence in sentences:
+            for gram in _ngrams(sentence):
+                language_counts[gram] = language_counts.get(gram, 0) + 1
+                vocabulary[len(gram)].add(gram)
+
+    profiles = {}
+    for language, language_counts in counts.items():
+        ngrams, unseen = {}, {}
+        for order in NGRAM_ORDERS:
+            order_counts = {g: c for g, c in language_counts.items() if len(g) == order}
+            denominator = sum(order_counts.values()) + alpha * len(vocabulary[order])
+            top = sorted(order_counts.items(), key=lambda item: (-item[1], item[0]))[:max_ngrams_per_order]
+            for gram, count in top:
+                ngrams[gram] = round(math.log((count + alpha) / denominator), 3)
+            unseen[str(order)] = round(math.log(alpha / denominator), 3)
+        profiles[language] = {"ngrams": ngrams, "unseen": unseen}
+    return {"orders": list(NGRAM_ORDERS), "profiles": profiles}
+
+
+class LanguageIdentifier:
+    """
+    On-box language identification for user queries, in microseconds.
+
+    Text in a script used by one supported language (Kana, Hangul, Han, Arabic,
+    Cyrillic, Devanagari) is classified by script. Latin-script text is scored
+    against character 1-3-gram profiles (built from data/language_samples.json by
+    scripts/build_language_profiles.py). `identify` returns the language and a
+    confidence in [0, 1]; short or ambiguous text gets a low confidence, and
+    `detect` returns None for it so callers can fall back to the LLM.
+    """
+
+    def __init__(self, profiles_path, min_confidence=0.8):
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._stats = {"detected": 0, "low_confidence": 0}
+        with open(profiles_path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.profiles = {
+            language: (profile["ngrams"], {int(order): lp for order, lp in profile["unseen"].items()})
+            for language, profile in data["profiles"].items()
+        }
+        self.languages = sorted(self.profiles) + sorted({entry[2] for entry in _SCRIPT_RANGES})
+
+    def detect(self, text):
+        """The language of `text`, or None when the confidence is below `min_confidence`."""
+        language, confidence = self.identify(text)
+        confident = confidence >= self.min_confidence
+        with self._lock:
+            self._stats["detected" if confident else "low_confidence"] += 1
+        return language if confident else None
+
+    def identify(self, text):
+        """(language, confidence); ("English", 0.0) when there is nothing to go on."""
+        script_counts = {}
+        confidence_by_language = {}
+        latin = other = 0
+        for char in text:
+            if not char.isalpha():
+                continue
+            language, confidence = _script_language(char)
+            if language:
+                script_counts[language] = script_counts.get(language, 0) + 1
+                confidence_by_language[language] = confidence
+            elif char < "ɐ":
+                latin += 1
+            else:
+                other += 1
+
+        letters = latin + other + sum(script_counts.values())
+        if not letters:
+            return "English", 0.0
+        if script_counts:
+            # Any kana makes Han text Japanese
+            if script_counts.get("Japanese"):
+                script_counts["Japanese"] += script_counts.pop("Chinese", 0)
+                confidence_by_language["Japanese"] = 1.0
+            language, count = max(script_counts.items(), key=lambda item: item[1])
+            if count >= latin:
+                confidence = confidence_by_language[language] * count / letters
+                if _FOREIGN_LETTERS.get(language, set()).intersection(text.lower()):
+                    confidence = min(confidence, 0.5)
+                return language, round(confidence, 3)
+        return self._identify_latin(text, latin, letters)
+
+    def _identify_latin(self, text, latin, letters):
+        grams = list(_ngrams(text))
+        if not grams:
+            return "English", 0.0
+        scores = {}
+        for language, (ngrams, unseen) in self.profiles.items():
+            scores[language] = sum(ngrams.get(gram, unseen[len(gram)]) for gram in grams) / len(grams)
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        total = sum(math.exp(SHARPNESS * (score - top)) for score in scores.values())
+        fit = min(1.0, max(0.0, (top - MIN_FIT) / (FULL_FIT - MIN_FIT)))
+        confidence = (1.0 / total) * fit * min(1.0, latin / MIN_LETTERS) * latin / letters
+        return best, round(confidence, 3)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["languages"] = self.languages
+        stats["min_confidence"] = self.min_confidence
+        return stats
+
+
+# Shared identifier; the profiles are loaded once per process
+language_identifier = LanguageIdentifier(Config.LANGUAGE_PROFILES_PATH, Config.LANGUAGE_ID_MIN_CONFIDENCE)
@@ -0,0 +1,272 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from utils.config import Config
+
+
+class MediaCache:
+    """
+    Size-bounded store for generated media (TTS mp3s, story images).
+
+    Files live in hash-prefix shard directories (`<root>/<2 hex chars>/<name>`) so
+    no directory grows to many thousands of entries. A SQLite index records kind,
+    size, last access and hit count for every file, shared by all worker
+    processes. Lookups and startup trust it and don't stat files unless asked to
+    `verify`; entries whose file turns out to be gone are discarded. When the
+    total size in the index goes over `max_bytes`, the least recently used (or
+    least frequently used) files are deleted until usage is back under the
+    low-water mark.
+    """
+
+    # Access updates are batched and flushed to SQLite at most this often
+    FLUSH_INTERVAL_SECONDS = 30
+
+    def __init__(self, root, max_bytes, policy="lru", url_prefix="/audio", low_water_ratio=0.9):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.url_prefix = url_prefix
+        self.low_water_bytes = int(max_bytes * low_water_ratio)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / "index.db"), timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "name TEXT PRIMARY KEY, kind TEXT NOT NULL, size INTEGER NOT NULL, "
+            "last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.commit()
+        self._entries = {}  # name -> [kind, size, last_access, hits]
+        self._dirty = set()
+        self._last_flush = time.time()
+        self._stats = {"hits": 0, "misses": 0, "added": 0, "evicted": 0, "evicted_bytes": 0}
+        self._load_index()
+
+    # --- paths -------------------------------------------------------------
+
+    @staticmethod
+    def shard_for(name):
+        # Sharded by the part before the first dot, so derived files
+        # ("<stem>.w480.webp") land in the same directory as their original
+        return hashlib.md5(name.split(".", 1)[0].encode()).hexdigest()[:2]
+
+    def path_for(self, name):
+        """Sharded on-disk path for a media file name (the shard dir is created)."""
+        shard_dir = self.root / self.shard_for(name)
+        shard_dir.mkdir(exist_ok=True)
+        return shard_dir / name
+
+    def url_for(self, path_or_name):
+        name = os.path.basename(str(path_or_name))
+        return f"{self.url_prefix}/{self.shard_for(name)}/{name}"
+
+    # --- index -------------------------------------------------------------
+
+    def _load_index(self):
+        rows = self._conn.execute("SELECT name, kind, size, last_access, hits FROM entries").fetchall()
+        for name, kind, size, last_access, hits in rows:
+            self._entries[name] = [kind, size, last_access, hits]
+        if not rows:
+            # First start with this index: adopt files from a previous (flat) layout.
+            # This is the only time files are stat'ed.
+            self._rebuild_index()
+        print(f"Media cache: {len(self._entries)} files, {self._total_bytes_locked() / 1e6:.1f} MB of {self.max_bytes / 1e6:.0f} MB")
+
+    def _rebuild_index(self):
+        now = time.time()
+        rows = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and entry.name != "index.db" and not entry.name.startswith("index.db"):
+                # Legacy flat layout: move into its shard
+                target = self.path_for(entry.name)
+                os.replace(entry.path, target)
+                rows.append((entry.name, target))
+            elif entry.is_dir() and len(entry.name) == 2:
+                for sub in os.scandir(entry.path):
+                    if sub.is_file() and ".tmp" not in sub.name:
+                        rows.append((sub.name, Path(sub.path)))
+        for name, path in rows:
+            size = path.stat().st_size
+            self._entries[name] = [self._kind_for(name), size, now, 0]
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO entries (name, kind, size, last_access, hits) VALUES (?, ?, ?, ?, ?)",
+            [(name, *self._entries[name]) for name, _ in rows],
+        )
+        self._conn.commit()
+
+    def _total_bytes_locked(self):
+        # From the shared index, so files added by other workers count against the budget
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return self._total_bytes_locked()
+
+    @staticmethod
+    def _kind_for(name):
+        return "tts" if name.endswith(".mp3") else "image"
+
+    def _flush_locked(self, force=False):
+        if not self._dirty or (not force and time.time() - self._last_flush < self.FLUSH_INTERVAL_SECONDS):
+            return
+        self._conn.executemany(
+            "UPDATE entries SET last_access = ?, hits = ? WHERE name = ?",
+            [(self._entries[n][2], self._entries[n][3], n) for n in self._dirty if n in self._entries],
+        )
+        self._conn.commit()
+        self._dirty.clear()
+        self._last_flush = time.time()
+
+    # --- public API ------------------------------------------------------------
+
+    def lookup(self, name, verify=False):
+        """
+        Path of a cached file (recording the access) or None. Only the index is
+        consulted unless `verify` is set; see `entry`.
+        """
+        entry = self.entry(name, verify)
+        return entry[0] if entry else None
+
+    def contains(self, name):
+        """Whether `name` is indexed, without recording an access."""
+        with self._lock:
+            if name in self._entries:
+                return True
+            return self._conn.execute("SELECT 1 FROM entries WHERE name = ?", (name,)).fetchone() is not None
+
+    def entry(self, name, verify=False):
+        """
+        (path, size) of a cached file (recording the access) or None. With
+        `verify`, the file is checked on disk and a missing one is discarded
+        from the index and reported as a miss.
+        """
+        path = self.root / self.shard_for(name) / name
+        if verify and not path.is_file():
+            self.discard(name)
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                # Another worker process may have added it since we loaded the index
+                row = self._conn.execute(
+                    "SELECT kind, size, last_access, hits FROM entries WHERE name = ?", (name,)
+                ).fetchone()
+                if row is None:
+                    self._stats["misses"] += 1
+                    return None
+                entry = self._entries[name] = list(row)
+            entry[2] = time.time()
+            entry[3] += 1
+            self._dirty.add(name)
+            self._stats["hits"] += 1
+            self._flush_locked()
+            size = entry[1]
+        return path, size
+
+    def add(self, name, kind=None):
+        """Registers a file just written to `path_for(name)` and evicts if over budget."""
+        size = self.path_for(name).stat().st_size
+        with self._lock:
+            self._entries[name] = [kind or self._kind_for(name), size, time.time(), 0]
+            self._stats["added"] += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (name, kind, size, last_access, hits) VALUES (?, ?, ?, ?, ?)",
+                (name, *self._entries[name]),
+            )
+            self._conn.commit()
+            total_bytes = self._total_bytes_locked()
+            if total_bytes > self.max_bytes:
+                self._evict_locked(total_bytes, keep=name)
+
+    def discard(self, name):
+        """Drops an entry whose file turned out to be missing or invalid."""
+        with self._lock:
+            self._entries.pop(name, None)
+            self._dirty.discard(name)
+            self._conn.execute("DELETE FROM entries WHERE name = ?", (name,))
+            self._conn.commit()
+
+    def _evict_locked(self, total_bytes, keep=None):
+        # Ranked over the shared index (with this worker's pending accesses
+        # flushed), so every worker evicts against the same view
+        self._flush_locked(force=True)
+        if self.policy == "lfu":
+            order = "hits, last_access"  # fewest hits, then oldest
+        else:
+            order = "last_access"  # least recently used
+        victims = []
+        freed = 0
+        for name, size in self._conn.execute(f"SELECT name, size FROM entries ORDER BY {order}"):
+            if total_bytes - freed <= self.low_water_bytes:
+                break
+            if name == keep:
+                continue
+            victims.append(name)
+            freed += size
+
+        for name in victims:
+            self._entries.pop(name, None)
+            self._dirty.discard(name)
+            try:
+                os.remove(self.root / self.shard_for(name) / name)
+            except FileNotFoundError:
+                pass
+        self._conn.executemany("DELETE FROM entries WHERE name = ?", [(n,) for n in victims])
+        self._conn.commit()
+        self._stats["evicted"] += len(victims)
+        self._stats["evicted_bytes"] += freed
+        print(f"Media cache: evicted {len(victims)} files ({freed / 1e6:.1f} MB)")
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked(force=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            by_kind = dict(self._conn.execute("SELECT kind, SUM(size) FROM entries GROUP BY kind").fetchall())
+            stats["files"] = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        stats["total_bytes"] = sum(by_kind.values())
+        stats["bytes_by_kind"] = by_kind
+        stats["max_bytes"] = self.max_bytes
+        stats["policy"] = self.policy
+        return stats
+
+
+class _LazyMediaCache:
+    """
+    Stand-in that builds the shared MediaCache on first use. Processes that only
+    import this module (e.g. spawned image encoders re-importing the app) never
+    open the index or load it.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+# Shared media store behind the /audio mount
+media_cache = _LazyMediaCache(lambda: MediaCache(
+    Config.MEDIA_CACHE_DIR,
+    max_bytes=Config.MEDIA_CACHE_MAX_BYTES,
+    policy=Config.MEDIA_CACHE_POLICY,
+))
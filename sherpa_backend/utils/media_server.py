@@ -0,0 +1,151 @@
+import os
+import re
+
+import anyio
+from starlette.responses import Response
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Content-addressed media (TTS audio is named by the md5 of text + voice) never changes
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{32}\.")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+MEDIA_TYPES = {
+    ".mp3": "audio/mpeg", ".png": "image/png", ".webp": "image/webp", ".avif": "image/avif",
+}
+
+
+def cache_control_for(name):
+    return IMMUTABLE_CACHE_CONTROL if _CONTENT_ADDRESSED.match(name) else DEFAULT_CACHE_CONTROL
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single-range `Range` header, None to serve the
+    whole file (no header, multiple ranges or unknown units), or "unsatisfiable".
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, end
+
+
+class MediaFileResponse(Response):
+    """
+    File response for cached media with ETag revalidation and byte ranges.
+    The body is read in chunks on a worker thread.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path, size, etag, media_type, request_headers, cache_control, vary=None, on_missing=None):
+        self.path = str(path)
+        self.on_missing = on_missing
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "cache-control": cache_control,
+        }
+        if vary:
+            headers["vary"] = vary
+        self.byte_range = None
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            super().__init__(status_code=304, headers=headers)
+            self.send_body = False
+            return
+
+        byte_range = parse_range(request_headers.get("range"), size)
+        if_range = request_headers.get("if-range")
+        if byte_range and if_range and if_range.strip() != etag:
+            byte_range = None  # The client's partial copy is of another version
+        if byte_range == "unsatisfiable":
+            headers["content-range"] = f"bytes */{size}"
+            super().__init__(status_code=416, headers=headers)
+            self.send_body = False
+            return
+
+        if byte_range:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            status_code = 206
+        else:
+            start, end = 0, size - 1
+            status_code = 200
+        self.byte_range = (start, end)
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(end - start + 1)
+        self.send_body = True
+
+    async def __call__(self, scope, receive, send):
+        if not self.send_body or scope.get("method") == "HEAD":
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            # Indexed but removed from disk behind the cache's back
+            if self.on_missing:
+                self.on_missing()
+            await Response(status_code=404)(scope, receive, send)
+            return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        start, end = self.byte_range
+        with f:
+            f.seek(start)
+            remaining = end - start + 1
+            if remaining <= 0:
+                await send({"type": "http.response.body", "body": b""})
+                return
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(f.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; close the response rather than hang
+                await send({"type": "http.response.body", "body": b""})
+
+
+def media_response(media_cache, name, request_headers, media_type=None, cache_control=None, vary=None):
+    """
+    Response for a file in the media cache, or None if it is not cached. This is
+    where the request's cache access is recorded, so callers that pick `name`
+    should probe with `media_cache.contains`. ETags come from the index (name
+    and size), so no file is hashed or stat'ed. If
+    the file is gone when the body is sent, its entry is discarded so it can be
+    regenerated.
+    """
+    entry = media_cache.entry(name)
+    if entry is None:
+        return None
+    path, size = entry
+    etag = f'"{name}-{size:x}"'
+    return MediaFileResponse(
+        path, size, etag,
+        media_type or MEDIA_TYPES.get(os.path.splitext(name)[1], "application/octet-stream"),
+        request_headers,
+        cache_control or cache_control_for(name),
+        vary=vary,
+        on_missing=lambda: media_cache.discard(name),
+    )
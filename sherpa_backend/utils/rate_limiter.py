@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+
+from utils.config import Config
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def reserve(self):
+        """
+        Takes one token and returns how long the caller must wait before using it.
+        Returns 0.0 when the budget is not exhausted.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            # Token is borrowed from the future; wait until it has been refilled
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Per-model QPM limiter with jittered exponential backoff for quota errors.
+    A single shared instance (`gemini_limiter`) is used by every agent so the
+    budget is enforced across the whole process.
+    """
+
+    def __init__(self, qpm, burst=None, max_retries=4, backoff_base=1.0, backoff_max=30.0):
+        self.qpm = qpm
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "throttled_calls": 0,
+            "throttled_seconds": 0.0,
+            "retries": 0,
+            "backoff_seconds": 0.0,
+            "quota_errors": 0,
+        }
+
+    def _bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.qpm, self.burst)
+                self._buckets[key] = bucket
+            return bucket
+
+    def _record(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def acquire(self, key):
+        """Blocks only if the QPM budget for `key` is exhausted."""
+        wait = self._bucket(key).reserve()
+        self._record(calls=1)
+        if wait > 0:
+            self._record(throttled_calls=1, throttled_seconds=wait)
+            print(f"[RateLimiter] {key} budget exhausted, waiting {wait:.2f}s")
+            time.sleep(wait)
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff delay for the given retry attempt."""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def call(self, key, fn, *args, **kwargs):
+        """Runs `fn` under the limiter, retrying quota errors with backoff."""
+        attempt = 0
+        while True:
+            self.acquire(key)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not is_quota_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                self._record(quota_errors=1, retries=1, backoff_seconds=delay)
+                print(f"[RateLimiter] {key} quota exceeded, retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        stats["backoff_seconds"] = round(stats["backoff_seconds"], 3)
+        stats["qpm"] = self.qpm
+        return stats
+
+
+def is_quota_error(error):
+    """True for 429 / ResourceExhausted errors from Vertex AI or HTTP clients."""
+    try:
+        from google.api_core import exceptions as google_exceptions
+        if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+            return True
+    except ImportError:
+        pass
+    response = getattr(error, "response", None)
+    return 429 in (
+        getattr(error, "code", None),
+        getattr(error, "status_code", None),
+        getattr(response, "status_code", None),
+    )
+
+
+def model_key(model):
+    """Name used to key the per-model budget for a Vertex GenerativeModel."""
+    return getattr(model, "_model_name", None) or Config.TEXT_MODEL
+
+
+# Shared limiter for all Gemini calls in this process
+gemini_limiter = RateLimiter(
+    qpm=Config.GEMINI_QPM,
+    burst=Config.GEMINI_BURST,
+    max_retries=Config.GEMINI_MAX_RETRIES,
+    backoff_base=Config.GEMINI_BACKOFF_BASE,
+    backoff_max=Config.GEMINI_BACKOFF_MAX,
+)
@@ -0,0 +1,242 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.config import Config
+
+
+class SessionState:
+    """Per-user conversation state for the CityWalkAgent."""
+
+    def __init__(self, session_id, conversation=None, language="English", last_city_name="", preferences=None,
+                 summary="", prompt_tokens=None):
+        self.session_id = session_id
+        # Recent turns only: the visitor's query and the guide's speech
+        self.conversation = conversation if conversation is not None else []
+        # Rolling summary of the turns compacted out of `conversation`
+        self.summary = summary
+        self.language = language
+        self.last_city_name = last_city_name
+        self.preferences = preferences if preferences is not None else {}
+        # Estimated main-prompt tokens of recent turns (prompt-size growth reporting)
+        self.prompt_tokens = prompt_tokens if prompt_tokens is not None else []
+        # Serializes turns of the same session (e.g. double-clicks from one client)
+        self.lock = threading.RLock()
+
+    def reset(self):
+        self.conversation = []
+        self.summary = ""
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "conversation": self.conversation,
+            "summary": self.summary,
+            "language": self.language,
+            "last_city_name": self.last_city_name,
+            "preferences": self.preferences,
+            "prompt_tokens": self.prompt_tokens,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            session_id=data["session_id"],
+            conversation=data.get("conversation", []),
+            language=data.get("language", "English"),
+            last_city_name=data.get("last_city_name", ""),
+            preferences=data.get("preferences", {}),
+            summary=data.get("summary", ""),
+            prompt_tokens=data.get("prompt_tokens", []),
+        )
+
+
+class FileSessionBackend:
+    """Stores each session as a JSON file in `directory`."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, session_id):
+        safe_id = "".join(c for c in session_id if c.isalnum() or c in ("-", "_"))
+        return self.directory / f"{safe_id}.json"
+
+    def load(self, session_id):
+        path = self._path(session_id)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, session_id, data):
+        path = self._path(session_id)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, session_id):
+        try:
+            self._path(session_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def purge(self, ttl_seconds):
+        cutoff = time.time() - ttl_seconds
+        for path in self.directory.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SQLiteSessionBackend:
+    """Stores sessions in a single SQLite table; safe to share between workers."""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, data):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), time.time()),
+            )
+
+    def delete(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge(self, ttl_seconds):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl_seconds,))
+
+
+class SessionStore:
+    """
+    In-process LRU of SessionState objects with TTL eviction.
+    When a backend is configured, sessions are written through to it so that
+    any worker or host sharing the backend can pick up the conversation.
+    """
+
+    def __init__(self, backend=None, max_sessions=1000, ttl_seconds=3600):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()  # session_id -> (state, last_access)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id():
+        return uuid.uuid4().hex
+
+    def _evict(self, now):
+        # Expired entries first, then least recently used beyond capacity
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access > self.ttl_seconds or len(self._sessions) > self.max_sessions:
+                self._sessions.pop(session_id)
+            else:
+                break
+
+    def _load_from_backend(self, session_id):
+        try:
+            return self.backend.load(session_id)
+        except Exception as e:
+            print(f"Session backend load failed for {session_id}: {e}")
+            return None
+
+    def get(self, session_id):
+        """Returns the session for `session_id`, creating it if needed."""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            state = entry[0] if entry and now - entry[1] <= self.ttl_seconds else None
+            if state is None:
+                state = SessionState(session_id)
+            self._sessions[session_id] = (state, now)
+            self._evict(now)
+
+        # With a shared backend another worker may have advanced this session,
+        # so the backend copy is authoritative (a single row/file read).
+        if self.backend:
+            data = self._load_from_backend(session_id)
+            if data:
+                with state.lock:
+                    fresh = SessionState.from_dict(data)
+                    # Every persisted field, so new ones can't be left stale
+                    for field in fresh.to_dict():
+                        if field != "session_id":
+                            setattr(state, field, getattr(fresh, field))
+        return state
+
+    def save(self, state):
+        with self._lock:
+            if state.session_id in self._sessions:
+                self._sessions[state.session_id] = (state, time.time())
+                self._sessions.move_to_end(state.session_id)
+        if self.backend:
+            try:
+                self.backend.save(state.session_id, state.to_dict())
+            except Exception as e:
+                print(f"Session backend save failed for {state.session_id}: {e}")
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.backend:
+            self.backend.delete(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "backend": type(self.backend).__name__ if self.backend else None,
+            }
+
+
+def create_session_store():
+    """Builds the SessionStore configured via Config.SESSION_*."""
+    backend = None
+    if Config.SESSION_BACKEND == "sqlite":
+        backend = SQLiteSessionBackend(Config.SESSION_SQLITE_PATH)
+    elif Config.SESSION_BACKEND == "file":
+        backend = FileSessionBackend(Config.SESSION_FILE_DIR)
+    if backend:
+        backend.purge(Config.SESSION_TTL_SECONDS)
+    return SessionStore(
+        backend=backend,
+        max_sessions=Config.SESSION_MAX_IN_MEMORY,
+        ttl_seconds=Config.SESSION_TTL_SECONDS,
+    )
@@ -0,0 +1,141 @@
+import concurrent.futures
+import contextlib
+import os
+import threading
+from pathlib import Path
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent cache misses for the same key.
+
+    The first caller for a key (the leader) generates the value; callers that
+    arrive while it is in flight wait for the leader's result instead of making
+    their own paid API call. Counters are kept per namespace (e.g. "tts").
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}  # (namespace, key) -> Future
+        self._stats = {}
+
+    def _count(self, namespace, name):
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "coalesced": 0})
+            stats[name] += 1
+
+    def do(self, namespace, key, generate, lookup=None):
+        """
+        Returns `lookup()` if it is not None (a cache hit); otherwise runs
+        `generate()` once per key across concurrent callers and shares its result.
+        """
+        if lookup:
+            value = lookup()
+            if value is not None:
+                self._count(namespace, "hits")
+                return value
+
+        flight_key = (namespace, key)
+        with self._lock:
+            future = self._in_flight.get(flight_key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._in_flight[flight_key] = future
+
+        if not leader:
+            self._count(namespace, "coalesced")
+            return future.result()
+
+        self._count(namespace, "misses")
+        try:
+            # A previous leader may have finished between our lookup and now
+            value = lookup() if lookup else None
+            if value is None:
+                value = generate()
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(flight_key, None)
+
+    def stream(self, namespace, key, generate, replay, lookup=None):
+        """
+        Generator version of `do` for results that are reported progressively.
+        The leader yields the items of the `generate()` generator as they come
+        and shares its return value; cache hits and followers wait for the value
+        and yield the items of `replay(value)` instead. Returns the value.
+        """
+        if lookup:
+            value = lookup()
+            if value is not None:
+                self._count(namespace, "hits")
+                yield from replay(value)
+                return value
+
+        flight_key = (namespace, key)
+        with self._lock:
+            future = self._in_flight.get(flight_key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._in_flight[flight_key] = future
+
+        if not leader:
+            self._count(namespace, "coalesced")
+            value = future.result()
+            yield from replay(value)
+            return value
+
+        self._count(namespace, "misses")
+        try:
+            value = lookup() if lookup else None
+            if value is None:
+                value = yield from generate()
+            else:
+                yield from replay(value)
+            future.set_result(value)
+            return value
+        except GeneratorExit:
+            # The leader's consumer went away mid-generation
+            future.set_exception(RuntimeError(f"{namespace} generation for {key!r} was abandoned"))
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(flight_key, None)
+
+    def stats(self):
+        with self._lock:
+            stats = {namespace: dict(counts) for namespace, counts in self._stats.items()}
+            in_flight = len(self._in_flight)
+        stats["in_flight"] = in_flight
+        return stats
+
+
+@contextlib.contextmanager
+def atomic_write_path(path):
+    """
+    Yields a temporary path next to `path` to write to; it is renamed over `path`
+    only if the block succeeds, so readers never see a partially written file.
+    The temp name keeps the original suffix for writers that infer the format.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp{path.suffix}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+# Shared by TTS, story and image generation in this process
+single_flight = SingleFlight()
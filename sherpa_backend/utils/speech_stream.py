@@ -0,0 +1,104 @@
+import re
+
+_SPEECH_KEY = re.compile(r'"speech"\s*:\s*"')
+_HEX4 = re.compile(r'[0-9a-fA-F]{4}')
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+# Sentence end: terminal punctuation (Latin, CJK, Devanagari danda), optional closing
+# quotes/brackets, then whitespace. CJK terminators don't need the whitespace.
+_SENTENCE_END = re.compile(r'[.!?…]["\'”’)\]]*\s+|[。！？।]["\'”’)\]]*\s*')
+
+
+class SpeechFieldExtractor:
+    """
+    Incrementally decodes the "speech" string of a JSON object while the model
+    is still generating it. Feed raw text chunks; get back newly decoded speech.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = None  # index in buffer of the next undecoded speech char
+        self.done = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.done:
+            return ""
+        if self.position is None:
+            match = _SPEECH_KEY.search(self.buffer)
+            if not match:
+                return ""
+            self.position = match.end()
+
+        out = []
+        i = self.position
+        while i < len(self.buffer):
+            c = self.buffer[i]
+            if c == '"':
+                self.done = True
+                i += 1
+                break
+            if c == '\\':
+                if i + 1 >= len(self.buffer):
+                    break  # escape split across chunks
+                esc = self.buffer[i + 1]
+                if esc == 'u':
+                    if i + 6 > len(self.buffer):
+                        break
+                    code = self._hex4(i + 2)
+                    if code is not None and 0xD800 <= code <= 0xDBFF:
+                        # High surrogate: combine with the following \uDC00-\uDFFF,
+                        # waiting for it if the pair is split across chunks.
+                        follow = self.buffer[i + 6:i + 8]
+                        if follow in ("", "\\") or (follow == "\\u" and i + 12 > len(self.buffer)):
+                            break
+                        low = self._hex4(i + 8) if follow == "\\u" else None
+                        if low is not None and 0xDC00 <= low <= 0xDFFF:
+                            out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                            i += 12
+                            continue
+                        code = None
+                    elif code is not None and 0xDC00 <= code <= 0xDFFF:
+                        code = None  # lone low surrogate
+                    # Invalid hex and unpaired surrogates can't be encoded for TTS.
+                    out.append(chr(code) if code is not None else "\ufffd")
+                    i += 6
+                    continue
+                out.append(_ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            out.append(c)
+            i += 1
+        self.position = i
+        return "".join(out)
+
+    def _hex4(self, start):
+        digits = self.buffer[start:start + 4]
+        return int(digits, 16) if _HEX4.fullmatch(digits) else None
+
+
+class SentenceSplitter:
+    """
+    Buffers streamed text and emits complete sentences. Sentences shorter than
+    `min_chars` are merged with the next one to avoid tiny TTS requests.
+    """
+
+    def __init__(self, min_chars=25):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
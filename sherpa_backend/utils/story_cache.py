@@ -0,0 +1,101 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from utils.media_cache import media_cache
+from utils.ttl_lru import TTLLRU
+
+
+class StoryCache:
+    """
+    Persistent cache of generated stories (scene lists) shared by all workers.
+
+    Stories live in SQLite (WAL mode, so several processes can read and write it
+    concurrently) behind an in-memory LRU. Every entry carries a `version` derived
+    from the prompt and model configuration that produced it, so changing either
+    invalidates old stories without a manual purge. An entry is only served if
+    the audio and image files its scenes reference are still in the media cache.
+    """
+
+    def __init__(self, db_path, version, ttl_seconds=30 * 86400, max_memory_entries=500):
+        self.version = version
+        self.ttl_seconds = ttl_seconds
+        self._memory = TTLLRU(max_memory_entries, ttl_seconds)
+        self._db_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stories ("
+            "key TEXT PRIMARY KEY, version TEXT NOT NULL, scenes TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stale": 0, "missing_media": 0, "stored": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def _media_present(scenes):
+        for scene in scenes:
+            for field in ("audio_url", "image_url"):
+                url = scene.get(field)
+                if url and media_cache.lookup(url.rsplit("/", 1)[-1], verify=True) is None:
+                    return False
+        return True
+
+    def get(self, key):
+        """Cached scenes for `key`, or None when missing, expired, outdated or incomplete."""
+        entry = self._memory.get(key)
+        if entry:
+            scenes, source = entry[0], "memory_hits"
+        else:
+            with self._db_lock:
+                row = self._conn.execute(
+                    "SELECT version, scenes, updated_at FROM stories WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            if row[0] != self.version or time.time() - row[2] > self.ttl_seconds:
+                self._count("stale")
+                return None
+            scenes, source = json.loads(row[1]), "disk_hits"
+            self._memory.put(key, scenes, row[2])
+
+        if not self._media_present(scenes):
+            # Evicted or deleted media: regenerate rather than hand out dead URLs
+            self._count("missing_media")
+            self.delete(key)
+            return None
+        self._count(source)
+        return scenes
+
+    def put(self, key, scenes):
+        now = time.time()
+        # A copy, so the caller's later changes don't leak into what other requests are served
+        self._memory.put(key, [dict(scene) for scene in scenes], now)
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stories (key, version, scenes, updated_at) VALUES (?, ?, ?, ?)",
+                (key, self.version, json.dumps(scenes), now),
+            )
+            self._conn.commit()
+        self._count("stored")
+
+    def delete(self, key):
+        self._memory.pop(key)
+        with self._db_lock:
+            self._conn.execute("DELETE FROM stories WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["memory_entries"] = len(self._memory)
+        stats["version"] = self.version
+        return stats
@@ -0,0 +1,233 @@
+import json
+import threading
+
+_CLOSERS = {"{": "}", "[": "]"}
+# JSON Schema keywords the Vertex AI response_schema (OpenAPI subset) accepts
+_SCHEMA_KEYS = ("type", "format", "description", "enum", "items", "properties", "required", "nullable")
+_SCHEMA_TYPES = {"integer": "integer", "number": "number", "string": "string", "boolean": "boolean",
+                 "array": "array", "object": "object"}
+
+
+def response_schema_for(model, exclude=()):
+    """
+    Gemini `response_schema` for a pydantic model: its JSON schema with `$ref`s
+    inlined and reduced to the keywords Vertex AI accepts. Fields in `exclude`
+    (e.g. ones the server fills in itself) are left out.
+    """
+    schema = model.schema()
+    definitions = schema.get("definitions", {})
+
+    def convert(node):
+        if "$ref" in node:
+            return convert(definitions[node["$ref"].rsplit("/", 1)[-1]])
+        if "allOf" in node and len(node["allOf"]) == 1:
+            return convert(node["allOf"][0])
+        out = {}
+        for key in _SCHEMA_KEYS:
+            if key not in node:
+                continue
+            value = node[key]
+            if key == "type":
+                value = _SCHEMA_TYPES.get(value, "string")
+            elif key == "items":
+                value = convert(value)
+            elif key == "properties":
+                value = {name: convert(prop) for name, prop in value.items()}
+            out[key] = value
+        return out
+
+    converted = convert(schema)
+    for name in exclude:
+        converted["properties"].pop(name, None)
+    if "required" in converted:
+        converted["required"] = [name for name in converted["required"] if name not in exclude]
+    return converted
+
+
+def _strip_fences(text):
+    text = text.strip()
+    if text.startswith("```"):
+        lines = text.split("\n")
+        if lines[0].strip() in ("```json", "```"):
+            lines = lines[1:]
+        if lines and lines[-1].strip() == "```":
+            lines = lines[:-1]
+        text = "\n".join(lines)
+    return text.strip()
+
+
+class JSONStreamParser:
+    """
+    Incremental, tolerant parser for the first JSON object (or array) in model
+    output. Text around it (markdown fences, prose) is ignored.
+
+    Chunks are scanned once as they arrive, tracking nesting and string state, so
+    `feed` can report top-level fields as soon as their values are complete and
+    `result` can repair output that was cut off (e.g. at max_output_tokens) by
+    closing it at the last complete value.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.start = None  # index of the opening bracket
+        self.end = None  # index just past the matching closing bracket
+        self._scanned = 0
+        self._stack = []  # open brackets
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._expect_key = False  # next string in the current object is a key
+        self._safe = None  # (index, open brackets) of the last point the text can be cut and closed
+        self._field_end = None  # buffer index where the last complete top-level field ends
+        self._fields = {}
+
+    def feed(self, chunk):
+        """Adds a chunk. Returns the top-level fields completed by it, as {name: value}."""
+        self.buffer += chunk
+        if self.end is not None:
+            return {}
+        field_end = self._field_end
+        self._scan()
+        if self._field_end == field_end or self._stack[:1] != ["{"] and self.end is None:
+            return {}
+        return self._new_fields()
+
+    def _new_fields(self):
+        try:
+            if self.end is not None:
+                complete = json.loads(self.buffer[self.start:self.end])
+            else:
+                complete = json.loads(self.buffer[self.start:self._field_end] + "}")
+        except ValueError:
+            return {}
+        if not isinstance(complete, dict):
+            return {}
+        new = {key: value for key, value in complete.items() if key not in self._fields}
+        self._fields.update(new)
+        return new
+
+    def _mark_safe(self, index):
+        self._safe = (index, list(self._stack))
+        if len(self._stack) == 1:
+            self._field_end = index
+
+    def _scan(self):
+        buffer = self.buffer
+        i = self._scanned
+        if self.start is None:
+            positions = [p for p in (buffer.find("{", i), buffer.find("[", i)) if p != -1]
+            if not positions:
+                self._scanned = len(buffer)
+                return
+            i = self.start = min(positions)
+        while i < len(buffer):
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if not self._string_is_key:
+                        self._mark_safe(i + 1)
+            elif c == '"':
+                self._in_string = True
+                self._string_is_key = self._expect_key
+                self._expect_key = False
+            elif c in "{[":
+                self._stack.append(c)
+                self._expect_key = c == "{"
+                self._mark_safe(i + 1)
+            elif c in "}]":
+                if self._stack:
+                    self._stack.pop()
+                self._expect_key = False
+                if not self._stack:
+                    self.end = i + 1
+                    self._scanned = self.end
+                    return
+                self._mark_safe(i + 1)
+            elif c == ",":
+                # Everything up to the comma is a complete value (including numbers/literals)
+                self._mark_safe(i)
+                self._expect_key = self._stack[-1] == "{"
+            i += 1
+        self._scanned = i
+
+    def _closed(self, text, stack):
+        return text + "".join(_CLOSERS[b] for b in reversed(stack))
+
+    def result(self):
+        """
+        (value, repaired) for everything fed so far. `repaired` is True when the
+        output was truncated and had to be closed. Raises json.JSONDecodeError
+        when nothing usable was found, including truncated output that closes to
+        an empty object or array.
+        """
+        if self.start is None:
+            # No bracket at all: let json report the error (or parse a bare scalar)
+            return json.loads(_strip_fences(self.buffer)), False
+        if self.end is not None:
+            return json.loads(self.buffer[self.start:self.end]), False
+
+        candidates = []
+        if self._in_string and not self._string_is_key:
+            # Keep a cut-off string value (e.g. the speech) rather than dropping it
+            text = self.buffer[self.start:]
+            if self._escape:
+                text = text[:-1]
+            candidates.append(self._closed(text + '"', self._stack))
+        if self._safe:
+            index, stack = self._safe
+            candidates.append(self._closed(self.buffer[self.start:index], stack))
+        for candidate in candidates:
+            try:
+                value = json.loads(candidate)
+            except ValueError:
+                continue
+            if value not in ({}, []):
+                return value, True
+        raise json.JSONDecodeError("Unrepairable JSON output", self.buffer, self.start)
+
+
+def parse_json(text):
+    """(value, repaired) for model output that should contain one JSON value. See JSONStreamParser."""
+    parser = JSONStreamParser()
+    parser.feed(text or "")
+    return parser.result()
+
+
+def extract_json_text(text):
+    """The first balanced JSON object/array in `text` (fences and prose dropped), else the stripped text."""
+    if not text:
+        return None
+    parser = JSONStreamParser()
+    parser.feed(text)
+    if parser.end is not None:
+        return parser.buffer[parser.start:parser.end]
+    return _strip_fences(text)
+
+
+class ParseMetrics:
+    """Outcome counts of parsing one kind of structured model output."""
+
+    OUTCOMES = ("parsed", "repaired", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {outcome: 0 for outcome in self.OUTCOMES}
+        self._stats["dropped_items"] = 0
+
+    def record(self, outcome, dropped_items=0):
+        with self._lock:
+            self._stats[outcome] += 1
+            self._stats["dropped_items"] += dropped_items
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        total = sum(stats[outcome] for outcome in self.OUTCOMES)
+        # Calls whose output could not be used at all
+        stats["wasted_call_rate"] = round(stats["failed"] / total, 4) if total else 0.0
+        return stats
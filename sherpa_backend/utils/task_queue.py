@@ -0,0 +1,59 @@
+import concurrent.futures
+import threading
+
+
+class CoalescingTaskQueue:
+    """
+    Bounded background worker pool where only the latest task per key runs.
+
+    Submitting a task for a key that is already queued replaces the queued one;
+    submitting while it is running schedules one re-run with the newest task once
+    the current run finishes. Work that is superseded before it starts is dropped.
+    """
+
+    def __init__(self, max_workers=2, name="background"):
+        self.name = name
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> (fn, args, kwargs) waiting to run
+        self._running = set()
+        self._stats = {"submitted": 0, "coalesced": 0, "completed": 0, "failed": 0}
+
+    def submit(self, key, fn, *args, **kwargs):
+        with self._lock:
+            self._stats["submitted"] += 1
+            if key in self._pending:
+                self._stats["coalesced"] += 1
+            self._pending[key] = (fn, args, kwargs)
+            if key in self._running:
+                # The running task will pick up the newest pending one when done
+                return
+            self._running.add(key)
+        self.executor.submit(self._drain, key)
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                task = self._pending.pop(key, None)
+                if task is None:
+                    self._running.discard(key)
+                    return
+            fn, args, kwargs = task
+            try:
+                fn(*args, **kwargs)
+                with self._lock:
+                    self._stats["completed"] += 1
+            except Exception as e:
+                print(f"[{self.name}] Task for {key} failed: {e}")
+                with self._lock:
+                    self._stats["failed"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["running"] = len(self._running)
+        return stats
@@ -0,0 +1,38 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLLRU:
+    """Small thread-safe LRU with per-entry TTL. `get` returns (value, updated_at) or None."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value, updated_at=None):
+        with self._lock:
+            self._entries[key] = (value, updated_at or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,7 +1,13 @@
 import os
 import hashlib
+import sqlite3
+import threading
+import time
 from pathlib import Path
 from elevenlabs import ElevenLabs
+from utils.config import Config
+from utils.single_flight import single_flight, atomic_write_path
+from utils.media_cache import media_cache
 
 class TTSManager:
     # Language to voice ID mapping for native-sounding voices
@@ -29,20 +35,39 @@ class TTSManager:
         "arabic": "pNInz6obpgDQGcFmaJgB",    # Adam (Arabic)
         "russian": "yoZ06aMxZJJ28mfd3POQ",   # Dave (Russian)
     }
+
+    # Registered-but-not-yet-played streams kept for /api/tts/stream
+    MAX_PENDING_STREAMS = 1000
     
-    def __init__(self, cache_dir="audio_cache"):
+    def __init__(self, cache=None, stream_store_path=None):
         self.api_key = os.getenv("ELEVENLABS_API_KEY")
         if not self.api_key:
             print("Warning: ELEVENLABS_API_KEY not found in environment variables.")
         
         self.client = ElevenLabs(api_key=self.api_key)
-        self.cache_dir = Path(cache_dir)
-        self.cache_dir.mkdir(exist_ok=True)
+        self.cache = cache or media_cache
+        self._stats_lock = threading.Lock()
+        # Registered streams live in SQLite so any worker process can serve them
+        stream_store_path = Path(stream_store_path or Config.TTS_STREAM_STORE_PATH)
+        stream_store_path.parent.mkdir(parents=True, exist_ok=True)
+        self._streams_lock = threading.Lock()
+        self._streams = sqlite3.connect(str(stream_store_path), timeout=10, check_same_thread=False)
+        self._streams.execute("PRAGMA journal_mode=WAL")
+        self._streams.execute(
+            "CREATE TABLE IF NOT EXISTS pending_streams ("
+            "stream_id TEXT PRIMARY KEY, text TEXT NOT NULL, voice_id TEXT NOT NULL, model_id TEXT NOT NULL, "
+            "registered_at REAL NOT NULL)"
+        )
+        self._streams.commit()
+        self._stats = {
+            "cache_hits": 0, "synthesized": 0, "streamed": 0, "errors": 0,
+            "first_audio_ms_total": 0.0, "synthesis_ms_total": 0.0,
+        }
 
     def _get_cache_path(self, text, voice_id):
         # Create a unique filename based on text and voice_id
         content_hash = hashlib.md5(f"{text}:{voice_id}".encode()).hexdigest()
-        return self.cache_dir / f"{content_hash}.mp3"
+        return self.cache.path_for(f"{content_hash}.mp3")
     
     def _get_voice_for_language(self, language):
         """Get the appropriate voice ID for the given language."""
@@ -60,6 +85,61 @@ class TTSManager:
         # Default to English voice for unknown languages
         return self.LANGUAGE_VOICE_MAP["english"]
 
+    def _resolve_voice(self, language, voice_id):
+        """Voice and model for a request: (voice_id, model_id)."""
+        # Determine voice ID based on language if not explicitly provided
+        if voice_id is None:
+            voice_id = self._get_voice_for_language(language)
+        
+        # Use multilingual model for non-English, monolingual for English
+        is_english = language is None or language.lower().strip() in ["english", "en"]
+        model_id = "eleven_monolingual_v1" if is_english else "eleven_multilingual_v2"
+        return voice_id, model_id
+
+    def _synthesize(self, text, voice_id, model_id):
+        """Starts an ElevenLabs streaming synthesis; returns an iterator of mp3 chunks."""
+        return self.client.text_to_speech.stream(
+            text=text,
+            voice_id=voice_id,
+            model_id=model_id,
+            voice_settings={
+                "stability": 0.5,
+                "similarity_boost": 0.75,
+                "speed": 1.20  # Max allowed speed
+            }
+        )
+
+    def _record_synthesis(self, first_audio_seconds, total_seconds):
+        with self._stats_lock:
+            self._stats["synthesized"] += 1
+            self._stats["first_audio_ms_total"] += first_audio_seconds * 1000
+            self._stats["synthesis_ms_total"] += total_seconds * 1000
+        print(f"TTS first audio after {first_audio_seconds * 1000:.0f}ms, synthesis took {total_seconds * 1000:.0f}ms")
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _tee_to_cache(self, chunks, cache_path):
+        """
+        Yields synthesized chunks while writing them to a temp file that is
+        renamed into the cache only once the stream completed.
+        """
+        start = time.perf_counter()
+        first_audio = None
+        # If the client goes away or synthesis fails, the partial temp file is dropped
+        with atomic_write_path(cache_path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if first_audio is None:
+                        first_audio = time.perf_counter() - start
+                    f.write(chunk)
+                    yield chunk
+        self.cache.add(cache_path.name, "tts")
+        self._record_synthesis(first_audio or 0.0, time.perf_counter() - start)
+
     def generate_audio(self, text, language=None, voice_id=None):
         """
         Generates audio for the given text using ElevenLabs API.
@@ -73,44 +153,121 @@ class TTSManager:
         if not text:
             return None
         
-        # Determine voice ID based on language if not explicitly provided
-        if voice_id is None:
-            voice_id = self._get_voice_for_language(language)
-        
-        # Use multilingual model for non-English, monolingual for English
-        is_english = language is None or language.lower().strip() in ["english", "en"]
-        model_id = "eleven_monolingual_v1" if is_english else "eleven_multilingual_v2"
-
+        voice_id, model_id = self._resolve_voice(language, voice_id)
         cache_path = self._get_cache_path(text, voice_id)
 
         # Check cache
-        if cache_path.exists():
-            print(f"TTS Cache hit for: '{text[:20]}...'")
-            return str(cache_path)
+        def lookup():
+            if self.cache.lookup(cache_path.name, verify=True):
+                print(f"TTS Cache hit for: '{text[:20]}...'")
+                self._count("cache_hits")
+                return str(cache_path)
+            return None
 
         # Generate fresh audio using the new SDK method
-        print(f"TTS Generating ({language or 'English'}) for: '{text[:20]}...'")
-        try:
-            audio = self.client.text_to_speech.convert(
-                text=text,
-                voice_id=voice_id,
-                model_id=model_id,
-                voice_settings={
-                    "stability": 0.5,
-                    "stability": 0.5,
-                    "similarity_boost": 0.75,
-                    "speed": 1.20  # Max allowed speed
-                }
+        def generate():
+            print(f"TTS Generating ({language or 'English'}) for: '{text[:20]}...'")
+            try:
+                for _ in self._tee_to_cache(self._synthesize(text, voice_id, model_id), cache_path):
+                    pass
+                return str(cache_path)
+
+            except Exception as e:
+                print(f"Error generating TTS: {e}")
+                self._count("errors")
+                return None
+
+        # Concurrent requests for the same text+voice (streamed ones too, see
+        # open_stream) share one ElevenLabs call
+        return single_flight.do("tts", cache_path.stem, generate, lookup=lookup)
+
+    def register_stream(self, text, language=None, voice_id=None):
+        """
+        Remembers what to synthesize for a later streaming request and returns its
+        stream id (the cache key), so /answer can hand out an audio URL immediately.
+        """
+        if not text:
+            return None
+        voice_id, model_id = self._resolve_voice(language, voice_id)
+        stream_id = self._get_cache_path(text, voice_id).stem
+        with self._streams_lock:
+            self._streams.execute(
+                "INSERT OR REPLACE INTO pending_streams (stream_id, text, voice_id, model_id, registered_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (stream_id, text, voice_id, model_id, time.time()),
             )
-            
-            # Save to cache - audio is now bytes directly
-            with open(cache_path, "wb") as f:
-                for chunk in audio:
-                    f.write(chunk)
-            
-            return str(cache_path)
-            
-        except Exception as e:
-            print(f"Error generating TTS: {e}")
+            # Keep only the most recent registrations
+            self._streams.execute(
+                "DELETE FROM pending_streams WHERE stream_id NOT IN "
+                "(SELECT stream_id FROM pending_streams ORDER BY registered_at DESC LIMIT ?)",
+                (self.MAX_PENDING_STREAMS,),
+            )
+            self._streams.commit()
+        return stream_id
+
+    def _pending_stream(self, stream_id):
+        with self._streams_lock:
+            return self._streams.execute(
+                "SELECT text, voice_id, model_id FROM pending_streams WHERE stream_id = ?", (stream_id,)
+            ).fetchone()
+
+    def open_stream(self, stream_id, chunk_size=16384):
+        """
+        Iterator of mp3 chunks for a registered stream: read from the cache when
+        present, otherwise piped from ElevenLabs as it synthesizes (and cached).
+        Requests for audio already being synthesized in this process (streamed or
+        by generate_audio) wait for it and read the finished file. Returns None
+        for unknown ids.
+        """
+        if not stream_id or any(c not in "0123456789abcdef" for c in stream_id):
             return None
+        cache_path = self.cache.path_for(f"{stream_id}.mp3")
+
+        def lookup():
+            if self.cache.lookup(cache_path.name, verify=True):
+                self._count("cache_hits")
+                return str(cache_path)
+            return None
+
+        pending = self._pending_stream(stream_id)
+        if pending is None:
+            if lookup() is None:
+                return None
+            return self._read_file(cache_path, chunk_size)
+        text, voice_id, model_id = pending
+
+        def generate():
+            print(f"TTS Streaming for: '{text[:20]}...'")
+            self._count("streamed")
+            try:
+                yield from self._tee_to_cache(self._synthesize(text, voice_id, model_id), cache_path)
+                return str(cache_path)
+            except Exception as e:
+                print(f"Error streaming TTS: {e}")
+                self._count("errors")
+                return None
+
+        return single_flight.stream(
+            "tts", stream_id, generate, lambda path: self._read_file(path, chunk_size), lookup=lookup
+        )
+
+    @staticmethod
+    def _read_file(path, chunk_size):
+        if path is None:
+            return  # The synthesis this request waited for failed
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
 
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._streams_lock:
+            stats["pending_streams"] = self._streams.execute("SELECT COUNT(*) FROM pending_streams").fetchone()[0]
+        synthesized = stats["synthesized"]
+        stats["avg_first_audio_ms"] = round(stats.pop("first_audio_ms_total") / synthesized, 1) if synthesized else 0.0
+        stats["avg_synthesis_ms"] = round(stats.pop("synthesis_ms_total") / synthesized, 1) if synthesized else 0.0
+        return stats
@@ -0,0 +1,211 @@
+import concurrent.futures
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from utils.geocode_cache import normalize_place_name
+from utils.http_client import http_client
+from utils.ttl_lru import TTLLRU
+
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+# Wikipedia requires a User-Agent
+WIKIPEDIA_HEADERS = {
+    'User-Agent': 'SherpaTourGuide/1.0 (contact@example.com)'
+}
+# prop=extracts with exintro returns at most 20 pages per request
+EXTRACT_BATCH_SIZE = 20
+
+
+class WikipediaClient:
+    """
+    Wikipedia intro lookups with a two-level cache.
+
+    Level 1 maps a normalized search term to a pageid, level 2 maps a pageid to
+    its intro extract. Both live in an in-memory LRU backed by SQLite with a TTL,
+    so repeated or near-identical queries skip both HTTP calls. Extracts for
+    several pages are fetched in one batched `prop=extracts` request, and
+    `prefetch` warms the cache for landmark names in the background.
+    """
+
+    def __init__(self, db_path, ttl_seconds=7 * 86400, max_memory_entries=2000, prefetch_workers=4):
+        self.ttl_seconds = ttl_seconds
+        self._searches = TTLLRU(max_memory_entries, ttl_seconds)  # term -> pageid (0 = no result)
+        self._extracts = TTLLRU(max_memory_entries, ttl_seconds)  # pageid -> extract
+        self._db_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS searches (term TEXT PRIMARY KEY, pageid INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extracts (pageid INTEGER PRIMARY KEY, extract TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._prefetcher = concurrent.futures.ThreadPoolExecutor(
+            max_workers=prefetch_workers,
+            thread_name_prefix="wikipedia-prefetch"
+        )
+        self._stats = {
+            "search_memory_hits": 0, "search_disk_hits": 0, "search_fetches": 0,
+            "extract_memory_hits": 0, "extract_disk_hits": 0, "extract_fetches": 0,
+            "extract_batches": 0, "extract_unanswered": 0, "prefetched_terms": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    # --- disk level -------------------------------------------------------
+
+    def _disk_get(self, table, key_column, value_column, key):
+        with self._db_lock:
+            row = self._conn.execute(
+                f"SELECT {value_column}, updated_at FROM {table} WHERE {key_column} = ?", (key,)
+            ).fetchone()
+        if row and time.time() - row[1] <= self.ttl_seconds:
+            return row
+        return None
+
+    def _disk_put_many(self, table, rows):
+        with self._db_lock:
+            self._conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    # --- search: term -> pageid --------------------------------------------
+
+    def _cached_pageid(self, term):
+        entry = self._searches.get(term)
+        if entry:
+            self._count("search_memory_hits")
+            return entry[0]
+        row = self._disk_get("searches", "term", "pageid", term)
+        if row:
+            self._count("search_disk_hits")
+            self._searches.put(term, row[0], row[1])
+            return row[0]
+        return None
+
+    def search_pageid(self, query):
+        """Pageid of the best search hit for `query`; 0 when there is none."""
+        term = normalize_place_name(query)
+        pageid = self._cached_pageid(term)
+        if pageid is not None:
+            return pageid
+
+        self._count("search_fetches")
+        response = http_client.get(
+            WIKIPEDIA_API_URL,
+            endpoint="wikipedia.search",
+            params={'action': 'query', 'list': 'search', 'srsearch': query, 'srlimit': 1, 'format': 'json'},
+            headers=WIKIPEDIA_HEADERS
+        )
+        # Non-JSON responses raise ValueError and are not cached
+        search_data = response.json()
+        results = (search_data.get('query') or {}).get('search') or []
+        pageid = results[0]['pageid'] if results else 0
+        now = time.time()
+        self._searches.put(term, pageid, now)
+        self._disk_put_many("searches", [(term, pageid, now)])
+        return pageid
+
+    # --- extract: pageid -> intro text ----------------------------------------
+
+    def get_extracts(self, pageids):
+        """Intro extracts for `pageids`; cache misses are fetched in batched requests."""
+        extracts = {}
+        missing = []
+        for pageid in dict.fromkeys(p for p in pageids if p):
+            entry = self._extracts.get(pageid)
+            if entry:
+                self._count("extract_memory_hits")
+                extracts[pageid] = entry[0]
+                continue
+            row = self._disk_get("extracts", "pageid", "extract", pageid)
+            if row:
+                self._count("extract_disk_hits")
+                self._extracts.put(pageid, row[0], row[1])
+                extracts[pageid] = row[0]
+                continue
+            missing.append(pageid)
+
+        for start in range(0, len(missing), EXTRACT_BATCH_SIZE):
+            batch = missing[start:start + EXTRACT_BATCH_SIZE]
+            self._count("extract_batches")
+            self._count("extract_fetches", len(batch))
+            params = {
+                'action': 'query',
+                'prop': 'extracts',
+                'pageids': "|".join(str(p) for p in batch),
+                'explaintext': True,
+                'exintro': True,  # Only get the intro to be faster/smaller
+                'exlimit': 'max',
+                'format': 'json',
+            }
+            pages = {}
+            # Pages past `exlimit` come back without an extract and a `continue` to fetch them with
+            for _ in range(len(batch)):
+                data = http_client.get(
+                    WIKIPEDIA_API_URL,
+                    endpoint="wikipedia.extract",
+                    params=params,
+                    headers=WIKIPEDIA_HEADERS
+                ).json()
+                for key, page in ((data.get('query') or {}).get('pages') or {}).items():
+                    # Only answered pages: with an extract, or deleted/invalid ones (no article)
+                    if 'extract' in page or 'missing' in page or 'invalid' in page:
+                        pages[key] = page
+                if 'continue' not in data:
+                    break
+                params = {**params, **data['continue']}
+            now = time.time()
+            rows = []
+            for pageid in batch:
+                page = pages.get(str(pageid))
+                if page is None:
+                    # Not in this response (partial batch): left uncached so the next call retries it
+                    self._count("extract_unanswered")
+                    continue
+                extract = page.get('extract', '')
+                extracts[pageid] = extract
+                self._extracts.put(pageid, extract, now)
+                rows.append((pageid, extract, now))
+            self._disk_put_many("extracts", rows)
+        return extracts
+
+    def article(self, query):
+        """Intro of the best-matching article for `query` ('' when nothing matches)."""
+        pageid = self.search_pageid(query)
+        if not pageid:
+            return ""
+        return self.get_extracts([pageid]).get(pageid, "")
+
+    # --- prefetch ----------------------------------------------------------
+
+    def _prefetch(self, queries):
+        pageids = []
+        for query in queries:
+            try:
+                pageids.append(self.search_pageid(query))
+            except Exception as e:
+                print(f"Wikipedia prefetch search skipped for '{query}': {e}")
+        try:
+            self.get_extracts(pageids)
+        except Exception as e:
+            print(f"Wikipedia prefetch extracts skipped: {e}")
+        self._count("prefetched_terms", len(queries))
+
+    def prefetch(self, queries):
+        """Warm the cache for `queries` in the background (e.g. landmark names)."""
+        queries = [q for q in dict.fromkeys(queries) if q]
+        if queries:
+            self._prefetcher.submit(self._prefetch, queries)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["memory_searches"] = len(self._searches)
+        stats["memory_extracts"] = len(self._extracts)
+        return stats
@@ -99,6 +99,8 @@ function CityMap() {
   const [storyScenes, setStoryScenes] = useState([]);
   const [isStoryLoading, setIsStoryLoading] = useState(false);
   const [storyMonumentName, setStoryMonumentName] = useState('');
+  // Aborts the current story request and its image polling
+  const storyAbortRef = useRef(null);
 
   // Play audio with synchronized word-by-word captions
   const [isExpanded, setIsExpanded] = useState(false);  
@@ -266,14 +268,24 @@ function CityMap() {
     // Stop any other audio
     stopAudio();
 
+    // Updates from an earlier story's image polling must not reach this one
+    if (storyAbortRef.current) storyAbortRef.current.abort();
+    const controller = new AbortController();
+    storyAbortRef.current = controller;
+    const onScenesUpdate = (scenes) => {
+      if (!controller.signal.aborted) setStoryScenes(scenes);
+    };
+
     try {
-      const response = await fetchStory(landmark.displayName || landmark.name, location);
+      const response = await fetchStory(landmark.displayName || landmark.name, location, onScenesUpdate, controller.signal);
+      if (controller.signal.aborted) return;
       if (response && response.scenes) {
         setStoryScenes(response.scenes);
         setIsStoryOpen(true);
         setIsExpanded(false); // Minify the popup
       }
     } catch (error) {
+      if (error.name === 'AbortError') return;
       console.error("Story generation failed:", error);
       // Optional: Show error toast
     } finally {
@@ -648,7 +660,10 @@ function CityMap() {
       
       <StoryModal 
         isOpen={isStoryOpen} 
-        onClose={() => setIsStoryOpen(false)}
+        onClose={() => {
+          if (storyAbortRef.current) storyAbortRef.current.abort();
+          setIsStoryOpen(false);
+        }}
         scenes={storyScenes}
         monumentName={storyMonumentName}
       />
@@ -115,11 +115,16 @@ const StoryModal = ({ isOpen, onClose, scenes, monumentName }) => {
                     <img 
                       src={currentScene.image_url?.startsWith('http') 
                         ? currentScene.image_url 
-                        : (process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000') + currentScene.image_url} 
+                        : (process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000') + currentScene.image_url
+                          + (currentScene.image_url.startsWith('/images/') ? `?w=${Math.ceil(window.innerWidth * (window.devicePixelRatio || 1))}` : '')} 
                       alt={`Scene ${currentIndex + 1}`} 
                       className="story-image fade-in-image"
                       loading="eager"
                     />
+                ) : currentScene?.image_failed ? (
+                    <div className="placeholder-image">
+                        <span>Image unavailable</span>
+                    </div>
                 ) : (
                     <div className="placeholder-image">
                         <div className="loading-spinner"></div>
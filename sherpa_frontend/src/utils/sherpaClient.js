@@ -1,6 +1,9 @@
 import { TOGGLES } from '../config/toggles';
 import { mockStoryScenes } from '../data/mockStoryData';
 
+// Session id issued by the backend; keeps this tab's conversation separate from other users
+let guideSessionId = null;
+
 /**
  * Makes a request to the Voice View backend API
  * @param {string} query - The query or prompt to send
@@ -22,7 +25,8 @@ export const fetchGuideResponse = async (query, locationName, latitude, longitud
   
   try {
     const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000';
-    const response = await fetch(`${backendUrl}/answer?query=${encodeURIComponent(query)}`, {
+    const sessionParam = guideSessionId ? `&session_id=${encodeURIComponent(guideSessionId)}` : '';
+    const response = await fetch(`${backendUrl}/answer?query=${encodeURIComponent(query)}${sessionParam}`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -34,20 +38,78 @@ export const fetchGuideResponse = async (query, locationName, latitude, longitud
       throw new Error(`API call failed: ${response.statusText}`);
     }
 
-    return await response.json();
+    const data = await response.json();
+    if (data.session_id) {
+      guideSessionId = data.session_id;
+    }
+    return data;
   } catch (error) {
     console.error('Error fetching from backend:', error);
     throw error;
   }
 };
 
+// Waits `ms`, resolving early when `signal` is aborted
+const sleep = (ms, signal) => new Promise((resolve) => {
+  const timer = setTimeout(resolve, ms);
+  if (signal) {
+    signal.addEventListener('abort', () => {
+      clearTimeout(timer);
+      resolve();
+    }, { once: true });
+  }
+});
+
+/**
+ * Polls the image jobs of story scenes that are still rendering and reports
+ * updated scenes as each image becomes available. Scenes whose job failed (or
+ * is still pending when polling gives up) get `image_failed: true`.
+ * @param {string} backendUrl - Backend base URL
+ * @param {Array} scenes - Scenes from /api/generate_story
+ * @param {Function} onScenesUpdate - Called with a new scenes array after each update
+ * @param {AbortSignal} [signal] - Stops polling (and further updates) when aborted
+ */
+const pollImageJobs = async (backendUrl, scenes, onScenesUpdate, signal) => {
+  let current = scenes;
+  const aborted = () => signal && signal.aborted;
+  const settle = (scene, imageUrl) => {
+    const { image_job_id, ...rest } = scene;
+    const updated = imageUrl ? { ...rest, image_url: imageUrl } : { ...rest, image_failed: true };
+    current = current.map((s) => (s.scene_index === scene.scene_index ? updated : s));
+  };
+  for (let attempt = 0; attempt < 60 && current.some((scene) => scene.image_job_id); attempt++) {
+    await sleep(2000, signal);
+    if (aborted()) return;
+    for (const scene of current.filter((s) => s.image_job_id)) {
+      try {
+        const response = await fetch(`${backendUrl}/api/jobs/${scene.image_job_id}`, { signal });
+        const job = response.ok ? await response.json() : null;
+        if (aborted()) return;
+        if (!job || job.status === 'succeeded' || job.status === 'failed') {
+          settle(scene, job && job.status === 'succeeded' ? job.result.image_url : null);
+          onScenesUpdate(current);
+        }
+      } catch (error) {
+        if (aborted()) return;
+        console.error('Error polling image job:', error);
+      }
+    }
+  }
+  if (!aborted() && current.some((scene) => scene.image_job_id)) {
+    current.filter((s) => s.image_job_id).forEach((scene) => settle(scene, null));
+    onScenesUpdate(current);
+  }
+};
+
 /**
  * Fetches the generated story for a monument
  * @param {string} monumentName - Name of the monument
  * @param {string} locationContext - Context like "New Delhi, India"
+ * @param {Function} [onScenesUpdate] - Receives updated scenes as background images finish
+ * @param {AbortSignal} [signal] - Cancels the request and any image polling
  * @returns {Promise<Object>} - Promise resolving to { scenes: [] }
  */
-export const fetchStory = async (monumentName, locationContext) => {
+export const fetchStory = async (monumentName, locationContext, onScenesUpdate, signal) => {
   // Return mock data if toggle is enabled to save API costs
   if (TOGGLES.USE_MOCK_STORY) {
     console.log('Using mock story data (USE_MOCK_STORY is enabled)');
@@ -64,14 +126,19 @@ export const fetchStory = async (monumentName, locationContext) => {
       body: JSON.stringify({
         monument_name: monumentName,
         location_context: locationContext
-      })
+      }),
+      signal
     });
 
     if (!response.ok) {
       throw new Error(`Story API failed: ${response.statusText}`);
     }
 
-    return await response.json();
+    const data = await response.json();
+    if (onScenesUpdate && data.scenes && data.scenes.some((scene) => scene.image_job_id)) {
+      pollImageJobs(backendUrl, data.scenes, onScenesUpdate, signal);
+    }
+    return data;
   } catch (error) {
     console.error('Error fetching story:', error);
     throw error;